@@ -1,53 +1,627 @@
+import time
+# Taken before the other imports so the startup report includes them
+STARTUP_STARTED = time.perf_counter()
+
 import sys
 import sqlite3
+import html
+import json
+import threading
 import os
-import pickle
+import queue
+import multiprocessing
+import shutil
+import tempfile
+from bisect import bisect_left
+from collections import OrderedDict
 from PyQt6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QTextEdit, QPushButton, QListWidget, QMessageBox, QLabel,
-    QTabWidget, QMenuBar, QStatusBar, QFileDialog, QInputDialog, QMainWindow, QMenu, QHBoxLayout, QToolBar
+    QApplication, QWidget, QVBoxLayout, QTextEdit, QPushButton, QListView, QLineEdit, QMessageBox, QLabel,
+    QTabWidget, QMenuBar, QStatusBar, QFileDialog, QInputDialog, QMainWindow, QMenu, QHBoxLayout, QToolBar,
+    QProgressDialog, QAbstractItemView, QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView, QListWidget,
+    QListWidgetItem, QStyle, QComboBox
 )
 from PyQt6.QtGui import (
-    QAction, QTextDocument, QTextCursor, QTextCharFormat, QColor, QTextFormat, QFont, QIcon
+    QAction, QTextDocument, QTextCursor, QTextCharFormat, QColor, QTextFormat, QFont, QIcon, QImage, QPixmap,
+    QDesktopServices
+)
+from PyQt6.QtCore import (
+    Qt, QAbstractListModel, QModelIndex, QThread, QTimer, QFileSystemWatcher, QSize, QUrl, pyqtSignal, pyqtSlot
 )
-from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
-from PyQt6.QtCore import Qt
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from google.auth.transport.requests import Request
-from googleapiclient.http import MediaFileUpload
-
-# Google Drive authentication and service setup
-SCOPES = ['https://www.googleapis.com/auth/drive.file']
-CREDS = None
-
-def authenticate_google_drive():
-    global CREDS
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            CREDS = pickle.load(token)
-    if not CREDS or not CREDS.valid:
-        if CREDS and CREDS.expired and CREDS.refresh_token:
-            CREDS.refresh(Request())
+import perf
+from drive_sync import DriveSyncer, enqueue_upload
+from notebooks import SORT_CREATED, SORT_MODIFIED, SORT_TITLE, order_key, page_key, parse_tags
+from notestore import NoteStore, NoteConflictError, HIGHLIGHT_START, HIGHLIGHT_END, search_notes
+from pdf_export import export_pdfs
+from revisions import revision_digest
+
+# Startup timing. Set NOTENEST_STARTUP_REPORT to 1 (stderr) or a file path to
+# get a JSON report, checked against NOTENEST_STARTUP_BUDGET_MS.
+STARTUP_BUDGET_MS = 1500
+startup_marks = {"imports": time.perf_counter() - STARTUP_STARTED}
+
+# Note list
+LIST_PAGE_SIZE = 500
+
+# Search-as-you-type: wait for a pause in typing, then stream results in
+# batches. Running queries check for cancellation every SEARCH_PROGRESS_STEPS
+# SQLite VM instructions.
+SEARCH_DELAY_MS = 250
+SEARCH_RESULT_LIMIT = 1000
+SEARCH_BATCH_SIZE = 100
+SEARCH_PROGRESS_STEPS = 1000
+
+# Large notes saved before compression existed are compressed in the
+# background, starting this long after launch
+COMPRESS_START_DELAY_MS = 10000
+
+# Autosave waits this long after the last keystroke
+AUTOSAVE_DELAY_MS = 2000
+
+# Other processes writing notes.db (another window, the CLI) are noticed by
+# watching the database and its WAL, checked this long after a file change,
+# and by polling in case the file system doesn't report changes
+CHANGE_CHECK_DELAY_MS = 100
+CHANGE_POLL_MS = 5000
+
+# Open-note cache. QTextDocument keeps text as UTF-16 plus per-block layout
+# data, so sizes are estimated at a few bytes per character.
+DOCUMENT_CACHE_BYTES = 64 * 1024 * 1024
+DOCUMENT_BYTES_PER_CHAR = 6
+
+# Attachments: image thumbnails are made in the background on first show
+# and the most recent ones kept
+THUMBNAIL_SIZE = 96
+THUMBNAIL_CACHE_SIZE = 256
+
+# Organize menu: the choice for taking a note out of its notebook
+NO_NOTEBOOK = "(No Notebook)"
+
+# Performance panel (Tools > Performance)
+PERF_REFRESH_MS = 1000
+
+def mark_startup(name):
+    """Record how long after launch a startup milestone was first reached."""
+    if name not in startup_marks:
+        startup_marks[name] = time.perf_counter() - STARTUP_STARTED
+
+def write_startup_report():
+    target = os.environ.get("NOTENEST_STARTUP_REPORT")
+    if not target:
+        return
+    budget_ms = float(os.environ.get("NOTENEST_STARTUP_BUDGET_MS", STARTUP_BUDGET_MS))
+    report = {f"{name}_ms": round(seconds * 1000, 1) for name, seconds in startup_marks.items()}
+    report["budget_ms"] = budget_ms
+    report["over_budget"] = max(startup_marks.values()) * 1000 > budget_ms
+    line = json.dumps(report)
+    if target == "1":
+        if sys.stderr:
+            print(line, file=sys.stderr)
+    else:
+        with open(target, 'a', encoding='utf-8') as report_file:
+            report_file.write(line + "\n")
+
+def format_snippet(snippet):
+    """Convert an FTS5 snippet into rich text with the matches in bold."""
+    text = html.escape(snippet or "")
+    return text.replace(HIGHLIGHT_START, "<b>").replace(HIGHLIGHT_END, "</b>")
+
+def format_timestamp(seconds):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(seconds))
+
+class NoteListModel(QAbstractListModel):
+    """Note titles for the list view, fetched from SQLite a page at a time.
+
+    Rows are paged in by sort key as the view scrolls, filtered by notebook
+    and tag, and saves and deletes are applied to the loaded rows in place
+    instead of re-reading the table.
+    """
+
+    def __init__(self, store, parent=None, page_size=LIST_PAGE_SIZE):
+        super().__init__(parent)
+        self.store = store
+        self.page_size = page_size
+        self.sort = SORT_CREATED
+        self.notebook_id = None
+        self.tag_id = None
+        self.ids = []
+        self.titles = []
+        # order_key() of each row; None while showing fixed results, e.g. from a search
+        self.keys = []
+        # page_key() and order_key() of the last row fetched; every row up to it is loaded
+        self.after = None
+        self.after_key = None
+        self.tooltips = {}
+        self.exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.titles[row]
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self.tooltips.get(self.ids[row])
+        if role == Qt.ItemDataRole.UserRole:
+            return self.ids[row]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    @perf.timed("gui.fetch_more_notes")
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        rows = self.store.list_notes(self.after, self.page_size, self.sort, self.notebook_id, self.tag_id)
+        mark_startup("first_list_load")
+        if len(rows) < self.page_size:
+            self.exhausted = True
+        if rows:
+            start = len(self.ids)
+            self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+            for row in rows:
+                self.ids.append(row[0])
+                self.titles.append(row[1])
+                self.keys.append(order_key(self.sort, row))
+            self.endInsertRows()
+            self.after = page_key(self.sort, rows[-1])
+            self.after_key = self.keys[-1]
+
+    def set_view(self, sort, notebook_id, tag_id):
+        """Choose the order and filters for the next reload()."""
+        self.sort, self.notebook_id, self.tag_id = sort, notebook_id, tag_id
+
+    def reload(self):
+        """Drop the loaded rows; the view pages them back in as needed."""
+        self.beginResetModel()
+        self.ids, self.titles, self.keys, self.tooltips = [], [], [], {}
+        self.after = self.after_key = None
+        self.exhausted = False
+        self.endResetModel()
+
+    def set_results(self, rows, tooltips=None):
+        """Show a fixed list of (id, title) rows, e.g. search results."""
+        self.beginResetModel()
+        self.ids = [note_id for note_id, _ in rows]
+        self.titles = [title for _, title in rows]
+        self.keys = None
+        self.tooltips = tooltips or {}
+        self.exhausted = True
+        self.endResetModel()
+
+    def append_results(self, rows, tooltips=None):
+        if not rows:
+            return
+        start = len(self.ids)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        for note_id, title in rows:
+            self.ids.append(note_id)
+            self.titles.append(title)
+        self.tooltips.update(tooltips or {})
+        self.endInsertRows()
+
+    def note_id(self, index):
+        return self.ids[index.row()] if index.isValid() else None
+
+    def all_rows(self):
+        """Every (id, title) row the model can show, paging in the rest first."""
+        while self.canFetchMore():
+            self.fetchMore()
+        return list(zip(self.ids, self.titles))
+
+    def row_of(self, note_id):
+        if self.keys is not None and self.sort == SORT_CREATED:
+            row = bisect_left(self.keys, note_id)
+            return row if row < len(self.ids) and self.ids[row] == note_id else -1
+        try:
+            return self.ids.index(note_id)
+        except ValueError:
+            return -1
+
+    def is_loaded(self, key):
+        """Whether a row with this order key falls within the pages fetched so far."""
+        return self.exhausted or (self.after_key is not None and key <= self.after_key)
+
+    def note_saved(self, note_id, title):
+        row = self.row_of(note_id)
+        if self.keys is None or (self.sort == SORT_CREATED and self.notebook_id is None and self.tag_id is None):
+            if row >= 0:
+                self.titles[row] = title
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+            elif self.keys is not None and self.exhausted:
+                # New ids are always the largest, so the note goes at the end. If
+                # the list isn't fully loaded yet, fetchMore will pick it up.
+                self.insert_row(bisect_left(self.keys, note_id), note_id, title, note_id)
+            return
+        # The save may have moved the note in the sort order, or in or out of the filters
+        match = self.store.matching_note(note_id, self.notebook_id, self.tag_id)
+        key = order_key(self.sort, match) if match else None
+        # Past the pages fetched so far, fetchMore will pick it up
+        if row < 0:
+            if key is not None and self.is_loaded(key):
+                self.insert_row(bisect_left(self.keys, key), note_id, match[1], key)
+            return
+        if key is None or not self.is_loaded(key):
+            self.note_removed(note_id)
+            return
+        new_row = bisect_left(self.keys, key)
+        if new_row > row:
+            # Counted the note's own old position
+            new_row -= 1
+        if new_row != row:
+            # A move rather than a remove and insert keeps the note selected
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), new_row + (new_row > row))
+            for values in (self.ids, self.titles, self.keys):
+                values.insert(new_row, values.pop(row))
+            self.endMoveRows()
+        self.titles[new_row] = match[1]
+        self.keys[new_row] = key
+        index = self.index(new_row)
+        self.dataChanged.emit(index, index)
+
+    def insert_row(self, row, note_id, title, key):
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.ids.insert(row, note_id)
+        self.titles.insert(row, title)
+        self.keys.insert(row, key)
+        self.endInsertRows()
+
+    def note_removed(self, note_id):
+        row = self.row_of(note_id)
+        if row >= 0:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.ids[row]
+            del self.titles[row]
+            if self.keys is not None:
+                del self.keys[row]
+            self.tooltips.pop(note_id, None)
+            self.endRemoveRows()
+
+class DocumentCache:
+    """Recently opened notes kept as live QTextDocuments, least recently used first out.
+
+    Reusing a document skips re-parsing the note and keeps its undo history
+    and cursor. The cache is bounded by the estimated memory of the
+    documents rather than their number. Each entry remembers the version of
+    the note it was loaded from, so a note changed elsewhere is reloaded.
+    """
+
+    def __init__(self, dispose, max_bytes=DOCUMENT_CACHE_BYTES):
+        self.dispose = dispose
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+    def __contains__(self, document):
+        return any(entry[0] is document for entry in self.entries.values())
+
+    def get(self, note_id, version):
+        """The cached (document, text digest) for a note if it is still current.
+
+        version is the note's version as saved now; None skips the check.
+        """
+        entry = self.entries.get(note_id)
+        if entry is None:
+            return None
+        if version is not None and version != entry[1]:
+            self.invalidate(note_id)
+            return None
+        self.entries.move_to_end(note_id)
+        return entry[0], entry[2]
+
+    def version(self, note_id):
+        entry = self.entries.get(note_id)
+        return entry[1] if entry else None
+
+    def put(self, note_id, document, version, text_digest):
+        """Cache a document loaded from (or saved as) the given version of a note.
+
+        text_digest is the digest of the document's plain text, which autosave
+        compares against.
+        """
+        old = self.entries.pop(note_id, None)
+        if old:
+            self.total_bytes -= old[3]
+        size = document.characterCount() * DOCUMENT_BYTES_PER_CHAR
+        self.entries[note_id] = (document, version, text_digest, size)
+        self.total_bytes += size
+        # Keep the newest entry even if it alone is over budget
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            evicted_id = next(iter(self.entries))
+            self.drop(evicted_id)
+
+    def invalidate(self, note_id):
+        if note_id in self.entries:
+            self.drop(note_id)
+
+    def clear(self):
+        for note_id in list(self.entries):
+            self.drop(note_id)
+
+    def drop(self, note_id):
+        document, _, _, size = self.entries.pop(note_id)
+        self.total_bytes -= size
+        self.dispose(document)
+
+class SyncWorker(QThread):
+    """Drains the Drive sync outbox on a background thread.
+
+    The worker sleeps until a note is queued (see wake) or a failed upload
+    is due for another attempt.
+    """
+    progress = pyqtSignal(int, int)
+    queued = pyqtSignal(int)
+    synced = pyqtSignal(str, str)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, syncer, parent=None):
+        super().__init__(parent)
+        self.syncer = syncer
+        self.wake_event = threading.Event()
+        self.stopping = False
+        self.full_sync_requested = False
+
+    def wake(self):
+        self.wake_event.set()
+
+    def request_full_sync(self):
+        """Queue every note that changed since it was last synced."""
+        self.full_sync_requested = True
+        self.wake_event.set()
+
+    def stop(self):
+        self.stopping = True
+        self.wake_event.set()
+        self.wait()
+
+    def run(self):
+        while not self.stopping:
+            self.wake_event.clear()
+            try:
+                if self.full_sync_requested:
+                    self.full_sync_requested = False
+                    self.queued.emit(self.syncer.queue_changed())
+                self.syncer.run_due(self.progress.emit, self.synced.emit, self.failed.emit,
+                                    lambda: self.stopping)
+                delay = self.syncer.seconds_until_due()
+            except sqlite3.Error as e:
+                self.failed.emit("", str(e))
+                delay = 30.0
+            self.wake_event.wait(delay)
+
+class SearchWorker(QThread):
+    """Runs searches on its own read connection, newest request wins.
+
+    Starting a search bumps the generation counter; a query still running
+    for an older generation is interrupted through SQLite's progress
+    handler, and results are emitted in batches tagged with their
+    generation so stale ones can be ignored. The connection is replaced
+    whenever the store has been reopened since it was made, so searches
+    never read a database that was swapped out.
+    """
+    results = pyqtSignal(int, object, bool)
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.requests = queue.Queue()
+        self.generation = 0
+
+    def search(self, text, notebook_id=None, tag_id=None):
+        self.generation += 1
+        self.requests.put((self.generation, text, notebook_id, tag_id))
+        return self.generation
+
+    def cancel(self):
+        self.generation += 1
+
+    def stop(self):
+        self.cancel()
+        self.requests.put(None)
+        self.wait()
+
+    def run(self):
+        conn = None
+        open_count = None
+        try:
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    break
+                generation, text, notebook_id, tag_id = request
+                if generation != self.generation:
+                    continue
+                if open_count != self.store.open_count:
+                    # The store was reopened, e.g. after a restore, and this
+                    # connection would still be reading the replaced file
+                    if conn is not None:
+                        conn.close()
+                    open_count = self.store.open_count
+                    conn = self.store.connect(readonly=True)
+                conn.set_progress_handler(lambda: generation != self.generation, SEARCH_PROGRESS_STEPS)
+                try:
+                    cursor = search_notes(conn, text, SEARCH_RESULT_LIMIT, notebook_id, tag_id)
+                    batch = cursor.fetchmany(SEARCH_BATCH_SIZE) if cursor else []
+                    while batch and generation == self.generation:
+                        self.results.emit(generation, batch, False)
+                        batch = cursor.fetchmany(SEARCH_BATCH_SIZE)
+                    self.results.emit(generation, [], True)
+                except sqlite3.OperationalError as e:
+                    # An interrupted query just means a newer search superseded it
+                    if generation == self.generation:
+                        self.failed.emit(generation, str(e))
+                finally:
+                    conn.set_progress_handler(None, 0)
+        finally:
+            if conn is not None:
+                conn.close()
+
+class ThumbnailWorker(QThread):
+    """Scales attached images down to thumbnails, one request at a time.
+
+    Works on QImage only, which is safe off the GUI thread; the window
+    turns results into pixmaps. A null image means the blob isn't a
+    readable image.
+    """
+    ready = pyqtSignal(str, QImage)
+
+    def __init__(self, blobs, parent=None):
+        super().__init__(parent)
+        self.blobs = blobs
+        self.requests = queue.Queue()
+
+    def request(self, digest):
+        self.requests.put(digest)
+
+    def stop(self):
+        self.requests.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            digest = self.requests.get()
+            if digest is None:
+                break
+            try:
+                with self.blobs.mapped(digest) as data:
+                    image = QImage.fromData(data)
+            except (OSError, ValueError):
+                image = QImage()
+            if not image.isNull():
+                image = image.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.AspectRatioMode.KeepAspectRatio,
+                                     Qt.TransformationMode.SmoothTransformation)
+            self.ready.emit(digest, image)
+
+class TaskWorker(QThread):
+    """Runs a blocking task(progress) call on a background thread."""
+    progress = pyqtSignal(int, int)
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, task, parent=None):
+        super().__init__(parent)
+        self.task = task
+
+    def run(self):
+        try:
+            result = self.task(self.progress.emit)
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(result)
+
+class PerformancePanel(QWidget):
+    """Timings recorded by perf, refreshed while the tab is showing."""
+    STAT_COLUMNS = ("Operation", "Calls", "Mean ms", "p95 ms", "Max ms", "Total ms", "Rows")
+    SLOW_COLUMNS = ("ms", "Rows", "Thread", "At", "SQL")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.record_box = QCheckBox("Record")
+        self.record_box.setChecked(perf.enabled)
+        self.record_box.toggled.connect(perf.enable)
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        export_button = QPushButton("Export JSON...")
+        export_button.clicked.connect(self.export_json)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close_tab)
+        self.summary = QLabel()
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.record_box)
+        controls.addWidget(self.summary, 1)
+        controls.addWidget(reset_button)
+        controls.addWidget(export_button)
+        controls.addWidget(close_button)
+
+        # Slowest first, by total time and by duration
+        self.stat_table = self.make_table(self.STAT_COLUMNS, stretch_column=0, sort_column=5)
+        self.slow_table = self.make_table(self.SLOW_COLUMNS, stretch_column=4, sort_column=0)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(controls)
+        layout.addWidget(self.stat_table, 2)
+        layout.addWidget(QLabel(f"SQL slower than {perf.SLOW_SQL_MS} ms (latest {perf.SLOW_SQL_KEEP}):"))
+        layout.addWidget(self.slow_table, 1)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(PERF_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def make_table(self, columns, stretch_column, sort_column):
+        table = QTableWidget(0, len(columns))
+        table.setHorizontalHeaderLabels(columns)
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(stretch_column, QHeaderView.ResizeMode.Stretch)
+        table.setSortingEnabled(True)
+        table.sortByColumn(sort_column, Qt.SortOrder.DescendingOrder)
+        return table
+
+    def fill_table(self, table, rows):
+        sort_column = table.horizontalHeader().sortIndicatorSection()
+        sort_order = table.horizontalHeader().sortIndicatorOrder()
+        table.setSortingEnabled(False)
+        table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                item = QTableWidgetItem()
+                # Numbers go in as numbers, so the columns sort numerically
+                item.setData(Qt.ItemDataRole.DisplayRole, value)
+                table.setItem(row, column, item)
+        table.setSortingEnabled(True)
+        table.sortByColumn(sort_column, sort_order)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        snapshot = perf.snapshot()
+        self.record_box.setChecked(snapshot["enabled"])
+        self.fill_table(self.stat_table, [
+            (name, stat["count"], stat["mean_ms"], stat["p95_ms"], stat["max_ms"], stat["total_ms"], stat["rows"])
+            for name, stat in snapshot["stats"].items()
+        ])
+        self.fill_table(self.slow_table, [
+            (entry["ms"], entry["rows"], entry["thread"], entry["at"], entry["sql"]) for entry in snapshot["slow_sql"]
+        ])
+        if snapshot["recording_since"]:
+            self.summary.setText(f"Recording since {snapshot['recording_since']}")
         else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-            CREDS = flow.run_local_server(port=0)
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(CREDS, token)
-
-    try:
-        service = build('drive', 'v3', credentials=CREDS)
-        return service
-    except HttpError as error:
-        print(f'An error occurred: {error}')
-
-def upload_file_to_drive(file_path, file_name):
-    service = authenticate_google_drive()
-    file_metadata = {'name': file_name}
-    media = MediaFileUpload(file_path, mimetype='application/text')
-    file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-    print(f'File ID: {file["id"]}')
-    return file["id"]
+            self.summary.setText("Not recording")
+
+    def reset(self):
+        perf.reset()
+        self.refresh()
+
+    def export_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Performance Data", "notenest-performance.json",
+                                              "JSON Files (*.json)")
+        if not path:
+            return
+        try:
+            perf.export_json(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Export Error", f"Failed to export performance data: {str(e)}")
+
+    def close_tab(self):
+        tabs = self.parent()
+        while tabs is not None and not isinstance(tabs, QTabWidget):
+            tabs = tabs.parent()
+        if tabs is not None:
+            tabs.removeTab(tabs.indexOf(self))
 
 class NestNote(QMainWindow):
     def __init__(self):
@@ -76,9 +650,37 @@ class NestNote(QMainWindow):
         self.clear_button = QPushButton("New Note")
         self.export_button = QPushButton("Export as PDF")
         self.search_button = QPushButton("Search Notes")
+        self.attach_button = QPushButton("Attach File")
+
+        # Initialize Search Box
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search notes...")
+        self.search_box.setClearButtonEnabled(True)
+
+        # Initialize Note List Filters
+        self.notebook_filter = QComboBox()
+        self.tag_filter = QComboBox()
+        self.sort_box = QComboBox()
+        for label, sort in (("Date Created", SORT_CREATED), ("Last Modified", SORT_MODIFIED), ("Title", SORT_TITLE)):
+            self.sort_box.addItem(label, sort)
 
         # Initialize Notes List
-        self.note_list = QListWidget()
+        self.note_list = QListView()
+        self.note_list.setUniformItemSizes(True)
+        self.note_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+
+        # Initialize Attachment List, hidden while the note has none
+        self.attachment_list = QListWidget()
+        self.attachment_list.setViewMode(QListWidget.ViewMode.IconMode)
+        self.attachment_list.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.attachment_list.setWrapping(False)
+        self.attachment_list.setMaximumHeight(THUMBNAIL_SIZE + 48)
+        self.attachment_list.setContextMenuPolicy(Qt.ContextMenuPolicy.ActionsContextMenu)
+        self.attachment_list.hide()
+
+        # Notebook, tags and dates of the open note
+        self.note_details_label = QLabel()
+        self.note_details_label.setTextFormat(Qt.TextFormat.PlainText)
 
         # Create Menu Bar and Toolbar
         self.create_menu_bar()
@@ -95,8 +697,17 @@ class NestNote(QMainWindow):
 
         # Add Widgets to Notes Tab
         self.notes_layout.addWidget(QLabel("Saved Notes:"))
+        self.notes_layout.addWidget(self.search_box)
+        self.filter_layout = QHBoxLayout()
+        for label, widget in (("Notebook:", self.notebook_filter), ("Tag:", self.tag_filter),
+                              ("Sort by:", self.sort_box)):
+            self.filter_layout.addWidget(QLabel(label))
+            self.filter_layout.addWidget(widget, 1)
+        self.notes_layout.addLayout(self.filter_layout)
         self.notes_layout.addWidget(self.note_list)
         self.notes_layout.addWidget(self.text_editor)
+        self.notes_layout.addWidget(self.note_details_label)
+        self.notes_layout.addWidget(self.attachment_list)
 
         # Button Layout
         self.button_layout = QHBoxLayout()
@@ -106,6 +717,7 @@ class NestNote(QMainWindow):
         self.button_layout.addWidget(self.clear_button)
         self.button_layout.addWidget(self.export_button)
         self.button_layout.addWidget(self.search_button)
+        self.button_layout.addWidget(self.attach_button)
         self.notes_layout.addLayout(self.button_layout)
 
         # Status Bar
@@ -114,20 +726,121 @@ class NestNote(QMainWindow):
 
         # Database setup
         self.db_connect()
+        self.note_model = NoteListModel(self.store, self)
+        self.note_list.setModel(self.note_model)
+        self.refresh_filters()
         self.load_notes()
 
+        # Background Drive sync
+        self.sync_worker = SyncWorker(DriveSyncer(self.store.connect, blobs=self.store.blobs), self)
+        self.sync_worker.progress.connect(self.sync_progress)
+        self.sync_worker.queued.connect(self.sync_queued)
+        self.sync_worker.synced.connect(self.sync_finished)
+        self.sync_worker.failed.connect(self.sync_failed)
+        self.sync_worker.start()
+
+        # Search-as-you-type
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_worker = SearchWorker(self.store, self)
+        self.search_worker.results.connect(self.show_search_results)
+        self.search_worker.failed.connect(self.search_failed)
+        self.search_worker.start()
+        self.search_generation = 0
+        self.search_count = 0
+        self.db_task = None
+
+        # Background compression of large notes
+        self.compress_stop = threading.Event()
+        self.compress_task = TaskWorker(
+            lambda progress: self.store.compress_notes(progress=progress, should_stop=self.compress_stop.is_set), self
+        )
+        self.compress_task.succeeded.connect(self.compression_finished)
+        self.compress_task.failed.connect(
+            lambda error: self.status_bar.showMessage(f"Compressing notes failed: {error}", 5000)
+        )
+        QTimer.singleShot(COMPRESS_START_DELAY_MS, self.compress_task.start)
+        self.pdf_task = None
+        self.pdf_cancel = threading.Event()
+        self.perf_panel = None
+
+        # Open notes
+        self.doc_cache = DocumentCache(self.dispose_document)
+
+        # Chunked notes are streamed into the editor a chunk per event loop pass
+        self.stream = None
+        self.stream_timer = QTimer(self)
+        self.stream_timer.setInterval(0)
+        self.stream_timer.timeout.connect(self.append_next_chunk)
+
+        # Autosave
+        self.current_note_id = None
+        self.saved_digest = None
+        self.saved_version = None
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.setInterval(AUTOSAVE_DELAY_MS)
+        self.autosave_timer.timeout.connect(self.autosave)
+
+        # Attachments
+        self.attach_task = None
+        self.attachment_temp_dir = None
+        self.shown_attachments = None
+        self.thumbnails = OrderedDict()
+        self.thumbnails_pending = set()
+        self.thumbnail_worker = ThumbnailWorker(self.store.blobs, self)
+        self.thumbnail_worker.ready.connect(self.thumbnail_ready)
+        self.thumbnail_worker.start()
+        for label, slot in (("Open", self.open_attachment), ("Save As...", self.save_attachment_as),
+                            ("Remove", self.remove_attachment)):
+            action = QAction(label, self.attachment_list)
+            action.triggered.connect(slot)
+            self.attachment_list.addAction(action)
+
+        # Changes made by other processes
+        self.change_seq = self.store.last_change()
+        self.db_files = [os.path.abspath(self.store.path), os.path.abspath(self.store.path) + "-wal"]
+        self.db_inode = self.database_inode()
+        self.db_watcher = QFileSystemWatcher(self)
+        self.watch_database()
+        self.change_timer = QTimer(self)
+        self.change_timer.setSingleShot(True)
+        self.change_timer.setInterval(CHANGE_CHECK_DELAY_MS)
+        self.change_timer.timeout.connect(self.check_changes)
+        self.db_watcher.fileChanged.connect(self.change_timer.start)
+        self.change_poll_timer = QTimer(self)
+        self.change_poll_timer.setInterval(CHANGE_POLL_MS)
+        self.change_poll_timer.timeout.connect(self.check_changes)
+        self.change_poll_timer.start()
+
         # Event Listeners
         self.save_button.clicked.connect(self.save_note)
         self.sync_button.clicked.connect(self.sync_to_drive)
         self.delete_button.clicked.connect(self.delete_note)
         self.clear_button.clicked.connect(self.new_note)
-        self.note_list.itemClicked.connect(self.load_selected_note)
+        self.note_list.clicked.connect(self.load_selected_note)
+        self.text_editor.textChanged.connect(self.schedule_autosave)
+        self.search_box.textChanged.connect(self.search_timer.start)
+        self.notebook_filter.currentIndexChanged.connect(self.apply_filters)
+        self.tag_filter.currentIndexChanged.connect(self.apply_filters)
+        self.sort_box.currentIndexChanged.connect(self.apply_filters)
         self.export_button.clicked.connect(self.export_pdf)
         self.search_button.clicked.connect(self.search_notes)
+        self.attach_button.clicked.connect(self.attach_files)
+        self.attachment_list.itemActivated.connect(self.open_attachment)
 
         # Apply Stylesheet
         self.apply_stylesheet()
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if "first_paint" not in startup_marks:
+            mark_startup("first_paint")
+            # Report once the first paint and list load have both happened
+            QTimer.singleShot(0, write_startup_report)
+
     def set_default_text_color(self):
         """Set the default text color to black in the QTextEdit."""
         cursor = self.text_editor.textCursor()
@@ -149,10 +862,23 @@ class NestNote(QMainWindow):
         save_note_action.triggered.connect(self.save_note)
         file_menu.addAction(save_note_action)
 
+        self.autosave_action = QAction("Autosave", self)
+        self.autosave_action.setCheckable(True)
+        self.autosave_action.setChecked(True)
+        file_menu.addAction(self.autosave_action)
+
         export_pdf_action = QAction("Export as PDF", self)
         export_pdf_action.triggered.connect(self.export_pdf)
         file_menu.addAction(export_pdf_action)
 
+        attach_action = QAction("Attach Files...", self)
+        attach_action.triggered.connect(self.attach_files)
+        file_menu.addAction(attach_action)
+
+        export_notes_pdf_action = QAction("Export Notes as PDF...", self)
+        export_notes_pdf_action.triggered.connect(self.export_notes_pdf)
+        file_menu.addAction(export_notes_pdf_action)
+
         print_action = QAction("Print Note", self)
         print_action.triggered.connect(self.print_note)
         file_menu.addAction(print_action)
@@ -165,6 +891,10 @@ class NestNote(QMainWindow):
         restore_action.triggered.connect(self.restore_notes)
         file_menu.addAction(restore_action)
 
+        history_action = QAction("Note History", self)
+        history_action.triggered.connect(self.show_history)
+        file_menu.addAction(history_action)
+
         exit_action = QAction("Exit", self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
@@ -199,6 +929,26 @@ class NestNote(QMainWindow):
         search_action.triggered.connect(self.search_notes)
         edit_menu.addAction(search_action)
 
+        # Organize Menu
+        organize_menu = menubar.addMenu("Organize")
+        move_action = QAction("Move to Notebook...", self)
+        move_action.triggered.connect(self.move_to_notebook)
+        organize_menu.addAction(move_action)
+
+        tags_action = QAction("Edit Tags...", self)
+        tags_action.triggered.connect(self.edit_tags)
+        organize_menu.addAction(tags_action)
+
+        organize_menu.addSeparator()
+
+        new_notebook_action = QAction("New Notebook...", self)
+        new_notebook_action.triggered.connect(self.new_notebook)
+        organize_menu.addAction(new_notebook_action)
+
+        delete_notebook_action = QAction("Delete Notebook...", self)
+        delete_notebook_action.triggered.connect(self.delete_notebook)
+        organize_menu.addAction(delete_notebook_action)
+
         # View Menu
         view_menu = menubar.addMenu("View")
         fullscreen_action = QAction("Toggle Fullscreen", self)
@@ -243,6 +993,14 @@ class NestNote(QMainWindow):
         sync_action.triggered.connect(self.sync_to_drive)
         tools_menu.addAction(sync_action)
 
+        sync_all_action = QAction("Sync All Notes", self)
+        sync_all_action.triggered.connect(self.sync_all_to_drive)
+        tools_menu.addAction(sync_all_action)
+
+        performance_action = QAction("Performance", self)
+        performance_action.triggered.connect(self.show_performance)
+        tools_menu.addAction(performance_action)
+
         # Help Menu
         help_menu = menubar.addMenu("Help")
         about_action = QAction("About NestNote", self)
@@ -322,7 +1080,7 @@ class NestNote(QMainWindow):
             QPushButton#search_button:hover {
                 background-color: #546E7A;
             }
-            QListWidget {
+            QListView {
                 background-color: #ffffff;
                 border: 1px solid #cccccc;
                 font-size: 14px;
@@ -353,135 +1111,800 @@ class NestNote(QMainWindow):
         self.search_button.setObjectName("search_button")
 
     def db_connect(self):
-        self.conn = sqlite3.connect("notes.db")
-        self.cursor = self.conn.cursor()
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS notes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT UNIQUE,
-                content TEXT
-            )
-        """)
-        self.conn.commit()
+        self.store = NoteStore("notes.db")
 
+    @perf.timed("gui.load_notes")
     def load_notes(self):
-        self.note_list.clear()
-        self.cursor.execute("SELECT title FROM notes")
-        for note in self.cursor.fetchall():
-            self.note_list.addItem(note[0])
+        self.note_model.reload()
 
     def save_note(self):
-        note_title = self.text_editor.toPlainText().split("\n")[0]
+        self.write_note(autosave=False)
+
+    def schedule_autosave(self):
+        # Every keystroke restarts the timer, so a burst of typing is one save
+        if self.autosave_action.isChecked() and self.stream is None:
+            self.autosave_timer.start()
+
+    def autosave(self):
+        self.write_note(autosave=True)
+
+    def flush_autosave(self):
+        if self.autosave_timer.isActive():
+            self.autosave_timer.stop()
+            self.autosave()
+
+    @perf.timed("gui.save_note")
+    def write_note(self, autosave):
+        """Save the editor buffer unless it is unchanged since the last save or load."""
+        self.autosave_timer.stop()
+        if self.stream is not None:
+            if not autosave:
+                self.status_bar.showMessage("Wait for the note to finish loading before saving", 3000)
+            return
         note_content = self.text_editor.toPlainText()
+        note_title = note_content.split("\n", 1)[0]
 
         if note_title.strip() == "":
-            QMessageBox.warning(self, "Error", "Note title cannot be empty!")
+            if not autosave:
+                QMessageBox.warning(self, "Error", "Note title cannot be empty!")
             return
 
+        digest = revision_digest(note_content)
+        if self.current_note_id is not None and digest == self.saved_digest:
+            if not autosave:
+                self.status_bar.showMessage("No changes to save", 3000)
+            return
+
+        expected_version = self.saved_version if self.current_note_id is not None else None
         try:
-            self.cursor.execute("INSERT OR REPLACE INTO notes (title, content) VALUES (?, ?)", (note_title, note_content))
-            self.conn.commit()
-            self.load_notes()
-            self.status_bar.showMessage("Note saved successfully!", 3000)
+            try:
+                note_id, version = self.store.save_note(note_title, note_content, self.current_note_id,
+                                                        expected_version)
+            except NoteConflictError:
+                if autosave:
+                    self.status_bar.showMessage(
+                        f"Not autosaved: '{note_title}' was changed in another window. Save to choose what to keep.",
+                        5000)
+                    return
+                overwrite = QMessageBox.question(
+                    self, "Note Changed",
+                    f"'{note_title}' was changed in another window since you opened it. Overwrite those changes?",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+                if overwrite != QMessageBox.StandardButton.Yes:
+                    self.status_bar.showMessage("Note not saved", 3000)
+                    return
+                note_id, version = self.store.save_note(note_title, note_content, self.current_note_id)
         except sqlite3.IntegrityError:
-            QMessageBox.warning(self, "Error", "A note with this title already exists!")
-
+            if autosave:
+                self.status_bar.showMessage(f"Not autosaved: a note titled '{note_title}' already exists", 5000)
+            else:
+                QMessageBox.warning(self, "Error", "A note with this title already exists!")
+            return
+        except sqlite3.Error as e:
+            if autosave:
+                self.status_bar.showMessage(f"Not autosaved: {e}", 5000)
+            else:
+                QMessageBox.warning(self, "Save Error", f"Failed to save note: {str(e)}")
+            return
+        if expected_version is None and version == 1 and self.note_model.notebook_id is not None:
+            # A new note goes in the notebook being shown, so it stays in the list
+            self.store.set_notebook(note_id, self.note_model.notebook_id)
+        self.current_note_id = note_id
+        self.saved_digest = digest
+        self.saved_version = version
+        document = self.text_editor.document()
+        document.setModified(False)
+        if document.parent() is self:
+            self.doc_cache.put(note_id, document, version, digest)
+        self.note_model.note_saved(note_id, note_title)
+        self.show_note_details(note_id)
+        self.status_bar.showMessage("Note autosaved" if autosave else "Note saved successfully!", 3000)
+
+    @pyqtSlot()
+    @perf.timed("gui.sync_to_drive")
     def sync_to_drive(self):
-        note_title = self.text_editor.toPlainText().split("\n")[0]
+        if self.stream is not None:
+            self.status_bar.showMessage("Wait for the note to finish loading before syncing", 3000)
+            return
         note_content = self.text_editor.toPlainText()
+        note_title = note_content.split("\n", 1)[0]
 
         if note_title.strip() == "":
             QMessageBox.warning(self, "Error", "Note title cannot be empty!")
             return
-
-        temp_file = f"{note_title}.txt"
-        with open(temp_file, 'w') as file:
-            file.write(note_content)
+        if self.current_note_id is None:
+            # Drive files belong to notes by id, so there has to be one
+            self.status_bar.showMessage("Save the note before syncing it", 3000)
+            return
 
         try:
-            file_id = upload_file_to_drive(temp_file, note_title)
-            self.status_bar.showMessage(f"Note synced to Google Drive with ID {file_id}!", 3000)
-            os.remove(temp_file)
-        except Exception as e:
-            QMessageBox.warning(self, "Sync Error", f"Failed to sync to Google Drive: {str(e)}")
+            with self.store.write() as conn:
+                enqueue_upload(conn, self.current_note_id, note_title, note_content)
+        except sqlite3.Error as e:
+            QMessageBox.warning(self, "Sync Error", f"Failed to queue note for sync: {str(e)}")
+            return
+        self.sync_worker.wake()
+        self.status_bar.showMessage(f"'{note_title}' queued for Google Drive sync", 3000)
+
+    def sync_all_to_drive(self):
+        self.sync_worker.request_full_sync()
+        self.status_bar.showMessage("Checking notes for changes to sync...", 3000)
+
+    def sync_queued(self, count):
+        if count == 0:
+            self.status_bar.showMessage("All notes are already synced with Google Drive", 3000)
+
+    def sync_progress(self, done, total):
+        self.status_bar.showMessage(f"Syncing with Google Drive... {done}/{total}", 3000)
+
+    def sync_finished(self, note_title, file_id):
+        self.status_bar.showMessage(f"'{note_title}' synced to Google Drive with ID {file_id}!", 3000)
 
+    def sync_failed(self, note_title, error):
+        self.status_bar.showMessage(f"Sync of '{note_title}' failed, will retry: {error}", 5000)
+
+    @pyqtSlot()
+    @perf.timed("gui.load_selected_note")
     def load_selected_note(self):
-        selected_item = self.note_list.currentItem()
-        if selected_item:
-            note_title = selected_item.text()
-            self.cursor.execute("SELECT content FROM notes WHERE title = ?", (note_title,))
-            note_content = self.cursor.fetchone()
-            if note_content:
-                self.text_editor.setText(note_content[0])
+        note_id = self.note_model.note_id(self.note_list.currentIndex())
+        if note_id is None or note_id == self.current_note_id:
+            return
+        self.flush_autosave()
+        self.open_note(note_id)
+
+    def open_note(self, note_id):
+        self.show_attachments(note_id)
+        self.show_note_details(note_id)
+        # The version is read before the text: if the note is saved in
+        # between, the next save reports a conflict rather than losing it
+        version = self.store.note_version(note_id)
+        cached = self.doc_cache.get(note_id, version)
+        if cached:
+            document, text_digest = cached
+            self.show_document(document)
+        else:
+            chunk_count = self.store.chunk_count(note_id)
+            if chunk_count:
+                self.stream_note(note_id, chunk_count, version)
+                return
+            note_content = self.store.get_content(note_id)
+            if note_content is None:
+                return
+            document = self.new_document()
+            self.show_document(document)
+            self.text_editor.setText(note_content)
+            document.setModified(False)
+            text_digest = revision_digest(self.text_editor.toPlainText())
+            self.doc_cache.put(note_id, document, version, text_digest)
+        self.autosave_timer.stop()
+        self.current_note_id = note_id
+        self.saved_digest = text_digest
+        self.saved_version = version
+
+    def stream_note(self, note_id, chunk_count, version):
+        """Show the first chunk of a chunked note now and load the rest from the event loop.
+
+        Appending to a document the editor is showing relayouts it on every
+        insert, so the chunks go into a separate document that is swapped in
+        once complete. Until then the editor shows a read-only preview and
+        saving is off.
+        """
+        preview = self.new_document()
+        preview.setPlainText(self.store.get_chunk(note_id, 0) or "")
+        self.show_document(preview)
+        self.text_editor.setReadOnly(True)
+        self.autosave_timer.stop()
+        self.current_note_id = note_id
+        self.saved_digest = None
+        self.saved_version = version
+        document = self.new_document()
+        document.setUndoRedoEnabled(False)
+        self.stream = (note_id, document, chunk_count, version)
+        self.stream_seq = 0
+        self.stream_timer.start()
+
+    @perf.timed("gui.append_next_chunk")
+    def append_next_chunk(self):
+        note_id, document, chunk_count, version = self.stream
+        text = self.store.get_chunk(note_id, self.stream_seq)
+        if text is not None:
+            cursor = QTextCursor(document)
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(text)
+            self.stream_seq += 1
+        if text is not None and self.stream_seq < chunk_count:
+            self.status_bar.showMessage(f"Loading note... {100 * self.stream_seq // chunk_count}%")
+            return
+        self.stop_streaming()
+        latest = self.store.note_version(note_id)
+        if text is None or latest != version:
+            # The note was saved elsewhere while loading, so the chunks may
+            # be a mix of both versions; start over
+            document.deleteLater()
+            if latest is None:
+                self.status_bar.showMessage("This note was deleted in another window; saving it will bring it back",
+                                            5000)
+                return
+            self.stream_note(note_id, self.store.chunk_count(note_id), latest)
+            return
+        scroll = self.text_editor.verticalScrollBar().value()
+        self.show_document(document)
+        self.text_editor.verticalScrollBar().setValue(scroll)
+        document.setUndoRedoEnabled(True)
+        document.setModified(False)
+        self.saved_digest = revision_digest(document.toPlainText())
+        self.doc_cache.put(note_id, document, version, self.saved_digest)
+        self.status_bar.clearMessage()
+
+    def stop_streaming(self):
+        """End a chunk stream, dropping the document if it is incomplete."""
+        self.stream_timer.stop()
+        if self.stream is not None and self.stream[2] > self.stream_seq:
+            self.stream[1].deleteLater()
+        self.stream = None
+        self.text_editor.setReadOnly(False)
+
+    def new_document(self):
+        document = QTextDocument(self)
+        document.setDefaultFont(self.text_editor.font())
+        return document
+
+    def show_document(self, document):
+        """Swap a document into the editor, letting go of the one it replaces."""
+        old = self.text_editor.document()
+        if old is document:
+            return
+        if self.stream is not None:
+            self.stop_streaming()
+        # Unsaved edits are dropped on switching notes, as before caching
+        if old.isModified():
+            self.doc_cache.invalidate(self.current_note_id)
+        # The editor deletes its own initial document; ours are ours to clean up
+        release = old.parent() is self and old not in self.doc_cache
+        self.text_editor.setDocument(document)
+        self.set_default_text_color()
+        if release:
+            old.deleteLater()
+
+    def dispose_document(self, document):
+        if document is not self.text_editor.document():
+            document.deleteLater()
+
+    def database_inode(self):
+        try:
+            return os.stat(self.db_files[0]).st_ino
+        except OSError:
+            return None
+
+    def watch_database(self):
+        # A watch ends when its file is removed or replaced, and the WAL
+        # comes and goes, so this is called again on every check
+        watched = self.db_watcher.files()
+        missing = [path for path in self.db_files if path not in watched and os.path.exists(path)]
+        if missing:
+            self.db_watcher.addPaths(missing)
+
+    def check_changes(self):
+        """Bring the note list and open notes up to date with saves made by other processes."""
+        self.watch_database()
+        if self.db_task and self.db_task.isRunning():
+            return
+        inode = self.database_inode()
+        if inode is not None and inode != self.db_inode:
+            # notes.db was swapped for another file, e.g. restored from a
+            # backup in another window; our connections still see the old one.
+            # Its change log starts afresh, so reload everything. Compression
+            # is stopped first so it can't put an old-file reader back in the pool
+            self.db_inode = inode
+            self.stop_compression()
+            self.store.close()
+            self.store.open()
+            self.compress_stop.clear()
+            self.compress_task.start()
+            self.change_seq = self.store.last_change()
+            self.reload_all_notes()
+            return
+        try:
+            self.change_seq, changed = self.store.changes_since(self.change_seq)
+        except sqlite3.Error:
+            return  # Busy; the next check will catch up
+        if changed is None:
+            self.reload_all_notes()
+            return
+        for note_id, title, version in changed:
+            if version is None:
+                self.note_model.note_removed(note_id)
+                self.doc_cache.invalidate(note_id)
+                if note_id == self.current_note_id:
+                    self.status_bar.showMessage("This note was deleted in another window; saving it will bring it back",
+                                                5000)
+                continue
+            self.note_model.note_saved(note_id, title)
+            if self.doc_cache.version(note_id) not in (None, version):
+                self.doc_cache.invalidate(note_id)
+            if note_id == self.current_note_id:
+                # Attachments, notebook and tags change without bumping the version
+                self.show_attachments(note_id)
+                self.show_note_details(note_id)
+                if version != self.saved_version:
+                    self.reload_open_note()
+        if changed:
+            self.refresh_filters()
+
+    def reload_all_notes(self):
+        """Reload everything, for when the change log can't say what changed."""
+        self.doc_cache.clear()
+        self.refresh_filters()
+        self.run_search()
+        if self.current_note_id is not None and self.store.note_version(self.current_note_id) != self.saved_version:
+            self.reload_open_note()
+
+    def reload_open_note(self):
+        """Show the saved text of the open note, unless the editor has unsaved edits to it."""
+        if self.stream is not None:
+            return
+        if self.text_editor.document().isModified():
+            self.status_bar.showMessage("This note was changed in another window; saving will ask before overwriting",
+                                        5000)
+            return
+        note_id, self.current_note_id = self.current_note_id, None
+        self.open_note(note_id)
+        if self.current_note_id is None:
+            self.status_bar.showMessage("This note was deleted in another window; saving it will bring it back", 5000)
+
+    def show_attachments(self, note_id):
+        """List a note's attachments under the editor; None clears the list."""
+        rows = self.store.list_attachments(note_id) if note_id is not None else []
+        if (note_id, rows) == self.shown_attachments:
+            return
+        self.shown_attachments = (note_id, rows)
+        self.attachment_list.clear()
+        for attachment_id, name, digest, size, mime_type in rows:
+            item = QListWidgetItem(self.attachment_icon(digest, mime_type), name)
+            item.setData(Qt.ItemDataRole.UserRole, (attachment_id, name, digest))
+            item.setToolTip(f"{name} ({size:,} bytes)")
+            self.attachment_list.addItem(item)
+        self.attachment_list.setVisible(bool(rows))
+
+    def attachment_icon(self, digest, mime_type):
+        """The cached thumbnail for an attachment, or a file icon while an image's thumbnail is made."""
+        icon = self.thumbnails.get(digest)
+        if icon is not None:
+            self.thumbnails.move_to_end(digest)
+            return icon
+        if mime_type and mime_type.startswith("image/") and digest not in self.thumbnails_pending:
+            self.thumbnails_pending.add(digest)
+            self.thumbnail_worker.request(digest)
+        return self.style().standardIcon(QStyle.StandardPixmap.SP_FileIcon)
+
+    def thumbnail_ready(self, digest, image):
+        self.thumbnails_pending.discard(digest)
+        if image.isNull():
+            icon = self.style().standardIcon(QStyle.StandardPixmap.SP_FileIcon)
+        else:
+            icon = QIcon(QPixmap.fromImage(image))
+        self.thumbnails[digest] = icon
+        while len(self.thumbnails) > THUMBNAIL_CACHE_SIZE:
+            self.thumbnails.popitem(last=False)
+        for row in range(self.attachment_list.count()):
+            item = self.attachment_list.item(row)
+            if item.data(Qt.ItemDataRole.UserRole)[2] == digest:
+                item.setIcon(icon)
+
+    def attach_files(self):
+        if self.current_note_id is None:
+            QMessageBox.warning(self, "Error", "Save the note before attaching files.")
+            return
+        if self.attach_task and self.attach_task.isRunning():
+            QMessageBox.information(self, "Attach Files", "Files are still being attached.")
+            return
+        paths, _ = QFileDialog.getOpenFileNames(self, "Attach Files")
+        if not paths:
+            return
+        note_id = self.current_note_id
+        # Large files are copied and hashed in the background
+        self.attach_task = TaskWorker(
+            lambda progress: [self.store.add_attachment(note_id, path, progress=progress) for path in paths], self
+        )
+        self.attach_task.progress.connect(
+            lambda done, total: self.status_bar.showMessage(f"Attaching files... {100 * done // max(total, 1)}%")
+        )
+        self.attach_task.succeeded.connect(lambda ids: self.attachments_added(note_id, len(ids)))
+        self.attach_task.failed.connect(
+            lambda error: QMessageBox.warning(self, "Attach Error", f"Failed to attach file: {error}")
+        )
+        self.attach_task.start()
+
+    def attachments_added(self, note_id, count):
+        if note_id == self.current_note_id:
+            self.show_attachments(note_id)
+        self.status_bar.showMessage(f"Attached {count} file{'s' if count != 1 else ''}", 3000)
+
+    def selected_attachment(self):
+        """(id, name, digest) of the highlighted attachment, or None."""
+        item = self.attachment_list.currentItem()
+        return item.data(Qt.ItemDataRole.UserRole) if item else None
+
+    @pyqtSlot()
+    def open_attachment(self):
+        """Open an attachment in its default application, from a temporary copy under its own name."""
+        attachment = self.selected_attachment()
+        if attachment is None:
+            return
+        _, name, digest = attachment
+        try:
+            if self.attachment_temp_dir is None:
+                self.attachment_temp_dir = tempfile.mkdtemp(prefix="notenest-")
+            folder = os.path.join(self.attachment_temp_dir, digest)
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, os.path.basename(name))
+            if not os.path.exists(path):
+                shutil.copyfile(self.store.blobs.path(digest), path)
+        except OSError as e:
+            QMessageBox.warning(self, "Attachment Error", f"Failed to open attachment: {str(e)}")
+            return
+        QDesktopServices.openUrl(QUrl.fromLocalFile(path))
 
+    @pyqtSlot()
+    def save_attachment_as(self):
+        attachment = self.selected_attachment()
+        if attachment is None:
+            return
+        _, name, digest = attachment
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Attachment", name)
+        if file_name:
+            try:
+                shutil.copyfile(self.store.blobs.path(digest), file_name)
+            except OSError as e:
+                QMessageBox.warning(self, "Attachment Error", f"Failed to save attachment: {str(e)}")
+
+    @pyqtSlot()
+    def remove_attachment(self):
+        attachment = self.selected_attachment()
+        if attachment is None:
+            return
+        attachment_id, name, _ = attachment
+        confirm = QMessageBox.question(self, "Remove Attachment", f"Remove '{name}' from this note?",
+                                       QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if confirm == QMessageBox.StandardButton.Yes:
+            self.store.remove_attachment(attachment_id)
+            self.show_attachments(self.current_note_id)
+
+    @pyqtSlot()
+    @perf.timed("gui.delete_note")
     def delete_note(self):
-        selected_item = self.note_list.currentItem()
-        if selected_item:
-            note_title = selected_item.text()
+        index = self.note_list.currentIndex()
+        note_id = self.note_model.note_id(index)
+        if note_id is not None:
+            note_title = index.data()
             confirm = QMessageBox.question(self, "Delete", f"Are you sure you want to delete '{note_title}'?",
                                            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if confirm == QMessageBox.StandardButton.Yes:
-                self.cursor.execute("DELETE FROM notes WHERE title = ?", (note_title,))
-                self.conn.commit()
-                self.load_notes()
-                self.text_editor.clear()
+                self.store.delete_note(note_id)
+                self.note_model.note_removed(note_id)
+                self.doc_cache.invalidate(note_id)
+                if note_id == self.current_note_id:
+                    # Don't let a pending autosave bring the note back
+                    self.autosave_timer.stop()
+                    self.new_note()
                 self.status_bar.showMessage("Note deleted successfully!", 3000)
 
     def new_note(self):
-        self.text_editor.clear()
+        self.flush_autosave()
+        self.show_document(self.new_document())
+        self.autosave_timer.stop()
+        self.current_note_id = None
+        self.saved_digest = None
+        self.saved_version = None
+        self.show_attachments(None)
+        self.show_note_details(None)
 
     def export_pdf(self):
         file_name, _ = QFileDialog.getSaveFileName(self, "Export PDF", "", "PDF Files (*.pdf)")
         if file_name:
+            from PyQt6.QtPrintSupport import QPrinter
+
             printer = QPrinter(QPrinter.PrinterMode.HighResolution)
             printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat)
             printer.setOutputFileName(file_name)
             document = QTextDocument()
             document.setPlainText(self.text_editor.toPlainText())
-            document.print_(printer)
+            document.print(printer)
             self.status_bar.showMessage(f"Note exported as PDF to {file_name}", 3000)
 
+    def export_notes_pdf(self):
+        """Export the selected notes, or every note in the list, in worker processes."""
+        if self.pdf_task and self.pdf_task.isRunning():
+            QMessageBox.information(self, "Export PDF", "Another PDF export is still running.")
+            return
+        selected = sorted(self.note_list.selectionModel().selectedIndexes(), key=lambda index: index.row())
+        if len(selected) > 1:
+            notes = [(self.note_model.note_id(index), index.data()) for index in selected]
+        else:
+            notes = self.note_model.all_rows()
+        if not notes:
+            QMessageBox.information(self, "Export PDF", "There are no notes to export.")
+            return
+        choices = ["One PDF per note", "Single merged PDF"]
+        choice, ok = QInputDialog.getItem(self, "Export PDF", f"Export {len(notes)} notes as:", choices, 0, False)
+        if not ok:
+            return
+        merged = choice == choices[1]
+        if merged:
+            dest, _ = QFileDialog.getSaveFileName(self, "Export PDF", "", "PDF Files (*.pdf)")
+        else:
+            dest = QFileDialog.getExistingDirectory(self, "Export PDF")
+        if not dest:
+            return
+        self.flush_autosave()
+
+        progress_dialog = QProgressDialog("Exporting notes as PDF...", "Cancel", 0, 0 if merged else len(notes), self)
+        progress_dialog.setWindowTitle("Export PDF")
+        progress_dialog.setMinimumDuration(0)
+        self.pdf_cancel.clear()
+        progress_dialog.canceled.connect(self.pdf_cancel.set)
+        font = self.text_editor.font().toString()
+        db_path = os.path.abspath(self.store.path)
+        self.pdf_task = TaskWorker(
+            lambda progress: export_pdfs(db_path, notes, dest, merged, font, progress, self.pdf_cancel.is_set),
+            self,
+        )
+        if not merged:
+            self.pdf_task.progress.connect(lambda done, total: progress_dialog.setValue(done))
+        self.pdf_task.succeeded.connect(lambda result: self.pdf_export_finished(result, dest, progress_dialog))
+        self.pdf_task.failed.connect(lambda error: self.pdf_export_failed(error, progress_dialog))
+        self.pdf_task.start()
+
+    def pdf_export_finished(self, result, dest, progress_dialog):
+        written, failures = result
+        cancelled = self.pdf_cancel.is_set()
+        progress_dialog.reset()
+        if failures:
+            details = "\n".join(f"{os.path.basename(path)}: {error}" for path, error in failures[:10])
+            QMessageBox.warning(self, "Export PDF", f"{len(failures)} PDFs could not be written:\n{details}")
+        if cancelled:
+            self.status_bar.showMessage(f"PDF export cancelled after {written} files", 5000)
+        else:
+            self.status_bar.showMessage(f"Exported {written} PDF files to {dest}", 3000)
+
+    def pdf_export_failed(self, error, progress_dialog):
+        progress_dialog.reset()
+        QMessageBox.warning(self, "Export PDF", f"PDF export failed: {error}")
+
     def print_note(self):
+        from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
+
         printer = QPrinter(QPrinter.PrinterMode.HighResolution)
         dialog = QPrintDialog(printer, self)
         if dialog.exec() == QPrintDialog.DialogCode.Accepted:
             document = QTextDocument()
             document.setPlainText(self.text_editor.toPlainText())
-            document.print_(printer)
+            document.print(printer)
+
+    def run_db_task(self, task, label, on_success, error_title):
+        """Run a backup or restore step in the background, one at a time."""
+        if self.db_task and self.db_task.isRunning():
+            QMessageBox.information(self, error_title, "Another backup or restore is still running.")
+            return
+        self.db_task = TaskWorker(task, self)
+        self.db_task.progress.connect(
+            lambda done, total: self.status_bar.showMessage(f"{label}... {100 * done // max(total, 1)}%")
+        )
+        self.db_task.succeeded.connect(on_success)
+        self.db_task.failed.connect(lambda error: QMessageBox.warning(self, error_title, f"{label} failed: {error}"))
+        self.db_task.start()
 
     def backup_notes(self):
-        file_name, _ = QFileDialog.getSaveFileName(self, "Backup Notes", "", "SQLite Database (*.db)")
+        file_name, selected_filter = QFileDialog.getSaveFileName(
+            self, "Backup Notes", "", "SQLite Database (*.db);;Compressed Backup (*.db.gz)"
+        )
         if file_name:
-            try:
-                with open(file_name, 'wb') as backup_file:
-                    for line in self.conn.iterdump():
-                        backup_file.write(f"{line}\n".encode('utf-8'))
-                self.status_bar.showMessage(f"Notes backed up to {file_name}", 3000)
-            except Exception as e:
-                QMessageBox.warning(self, "Backup Error", f"Failed to backup notes: {str(e)}")
+            compress = file_name.endswith(".gz") or selected_filter.startswith("Compressed")
+            self.run_db_task(
+                lambda progress: self.store.backup(file_name, progress, compress),
+                "Backing up notes",
+                lambda _: self.status_bar.showMessage(f"Notes backed up to {file_name}", 3000),
+                "Backup Error",
+            )
 
     def restore_notes(self):
-        file_name, _ = QFileDialog.getOpenFileName(self, "Restore Notes", "", "SQLite Database (*.db)")
+        file_name, _ = QFileDialog.getOpenFileName(
+            self, "Restore Notes", "", "Note Backups (*.db *.db.gz);;All Files (*)"
+        )
         if file_name:
-            try:
-                self.conn.close()
-                os.remove("notes.db")
-                os.rename(file_name, "notes.db")
-                self.db_connect()
-                self.load_notes()
-                self.status_bar.showMessage(f"Notes restored from {file_name}", 3000)
-            except Exception as e:
-                QMessageBox.warning(self, "Restore Error", f"Failed to restore notes: {str(e)}")
+            self.run_db_task(
+                lambda progress: self.store.prepare_restore(file_name, progress),
+                "Restoring notes",
+                lambda restored_path: self.finish_restore(restored_path, file_name),
+                "Restore Error",
+            )
+
+    def finish_restore(self, restored_path, file_name):
+        self.stop_compression()
+        try:
+            self.store.restore(restored_path)
+        except Exception as e:
+            QMessageBox.warning(self, "Restore Error", f"Failed to restore notes: {str(e)}")
+        else:
+            self.status_bar.showMessage(f"Notes restored from {file_name}", 3000)
+        self.compress_stop.clear()
+        self.compress_task.start()
+        self.autosave_timer.stop()
+        self.doc_cache.clear()
+        self.new_note()
+        self.refresh_filters()
+        self.load_notes()
+        self.db_inode = self.database_inode()
+        self.change_seq = self.store.last_change()
+
+    def compression_finished(self, count):
+        if count:
+            self.status_bar.showMessage(f"Compressed {count} large notes", 3000)
+
+    def stop_compression(self):
+        self.compress_stop.set()
+        self.compress_task.wait()
+
+    def show_history(self):
+        """Load an earlier revision of the current note into the editor."""
+        if self.current_note_id is None:
+            QMessageBox.information(self, "Note History", "Open a saved note to see its history.")
+            return
+        revisions = self.store.revisions(self.current_note_id)
+        if not revisions:
+            QMessageBox.information(self, "Note History", "This note has no saved revisions yet.")
+            return
+        labels = [f"Revision {rev} - {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created_at))}"
+                  for rev, created_at in revisions]
+        label, ok = QInputDialog.getItem(self, "Note History", "Revision:", labels, 0, False)
+        if ok:
+            rev = revisions[labels.index(label)][0]
+            content = self.store.load_revision(self.current_note_id, rev)
+            if content is not None:
+                self.text_editor.setPlainText(content)
+                self.status_bar.showMessage(f"Loaded revision {rev}; save to keep it", 5000)
+
+    def show_performance(self):
+        """Open the Performance tab and start recording timings."""
+        if self.perf_panel is None:
+            self.perf_panel = PerformancePanel()
+        perf.enable()
+        if self.tabs.indexOf(self.perf_panel) < 0:
+            self.tabs.addTab(self.perf_panel, "Performance")
+        self.tabs.setCurrentWidget(self.perf_panel)
+
+    def refresh_filters(self):
+        """Fill the notebook and tag filters, keeping the current choices while they still exist."""
+        vanished = False
+        for box, label, rows in ((self.notebook_filter, "All Notebooks", self.store.notebooks()),
+                                 (self.tag_filter, "All Tags", self.store.tags())):
+            items = [(label, None)] + [(name, item_id) for item_id, name in rows]
+            if items == [(box.itemText(i), box.itemData(i)) for i in range(box.count())]:
+                continue
+            current = box.currentData()
+            box.blockSignals(True)
+            box.clear()
+            for name, item_id in items:
+                box.addItem(name, item_id)
+            index = box.findData(current) if current is not None else 0
+            box.setCurrentIndex(max(index, 0))
+            box.blockSignals(False)
+            vanished = vanished or index < 0
+        if vanished:
+            self.apply_filters()
+
+    def apply_filters(self):
+        self.note_model.set_view(self.sort_box.currentData(), self.notebook_filter.currentData(),
+                                 self.tag_filter.currentData())
+        self.run_search()
+
+    def show_note_details(self, note_id):
+        """Show a note's notebook, tags and dates under the editor; None clears them."""
+        details = self.store.note_details(note_id) if note_id is not None else None
+        if details is None:
+            self.note_details_label.clear()
+            return
+        notebook, tags, created_at, modified_at = details
+        self.note_details_label.setText(
+            f"Notebook: {notebook or 'none'}   Tags: {', '.join(tags) or 'none'}   "
+            f"Created: {format_timestamp(created_at)}   Modified: {format_timestamp(modified_at)}")
+
+    def note_organized(self, note_id):
+        """Bring the list, filters and details up to date after filing or tagging a note."""
+        self.refresh_filters()
+        row = self.store.matching_note(note_id)
+        if row:
+            self.note_model.note_saved(note_id, row[1])
+        self.show_note_details(note_id)
+
+    def move_to_notebook(self):
+        """File the open note in a notebook, creating the notebook if the name is new."""
+        if self.current_note_id is None:
+            QMessageBox.information(self, "Move to Notebook", "Save the note before filing it in a notebook.")
+            return
+        details = self.store.note_details(self.current_note_id)
+        names = [NO_NOTEBOOK] + [name for _, name in self.store.notebooks()]
+        current = details[0] if details and details[0] else NO_NOTEBOOK
+        name, ok = QInputDialog.getItem(self, "Move to Notebook", "Notebook (type a name to create one):",
+                                        names, names.index(current), True)
+        name = " ".join(name.split())
+        if not ok or not name:
+            return
+        notebook_id = None if name == NO_NOTEBOOK else self.store.create_notebook(name)
+        self.store.set_notebook(self.current_note_id, notebook_id)
+        self.note_organized(self.current_note_id)
+
+    def edit_tags(self):
+        if self.current_note_id is None:
+            QMessageBox.information(self, "Edit Tags", "Save the note before tagging it.")
+            return
+        details = self.store.note_details(self.current_note_id)
+        text, ok = QInputDialog.getText(self, "Edit Tags", "Tags, separated by commas:",
+                                        text=", ".join(details[1] if details else []))
+        if ok:
+            self.store.set_tags(self.current_note_id, parse_tags(text))
+            self.note_organized(self.current_note_id)
+
+    def new_notebook(self):
+        name, ok = QInputDialog.getText(self, "New Notebook", "Notebook name:")
+        name = " ".join(name.split())
+        if ok and name:
+            self.store.create_notebook(name)
+            self.refresh_filters()
+            self.status_bar.showMessage(f"Notebook '{name}' created", 3000)
+
+    def delete_notebook(self):
+        notebooks = self.store.notebooks()
+        if not notebooks:
+            QMessageBox.information(self, "Delete Notebook", "There are no notebooks.")
+            return
+        names = [name for _, name in notebooks]
+        name, ok = QInputDialog.getItem(self, "Delete Notebook", "Notebook:", names, 0, False)
+        if not ok:
+            return
+        confirm = QMessageBox.question(self, "Delete Notebook",
+                                       f"Delete the notebook '{name}'? Its notes are kept, in no notebook.",
+                                       QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if confirm == QMessageBox.StandardButton.Yes:
+            self.store.delete_notebook(notebooks[names.index(name)][0])
+            self.refresh_filters()
+            if self.current_note_id is not None:
+                self.show_note_details(self.current_note_id)
+            self.status_bar.showMessage(f"Notebook '{name}' deleted", 3000)
 
     def search_notes(self):
-        search_text, ok = QInputDialog.getText(self, "Search Notes", "Enter search term:")
-        if ok and search_text:
-            self.cursor.execute("SELECT title FROM notes WHERE content LIKE ?", (f"%{search_text}%",))
-            results = self.cursor.fetchall()
-            self.note_list.clear()
-            for note in results:
-                self.note_list.addItem(note[0])
-            self.status_bar.showMessage(f"Found {len(results)} notes matching '{search_text}'", 3000)
+        self.search_box.setFocus()
+        self.search_box.selectAll()
+
+    @perf.timed("gui.run_search")
+    def run_search(self):
+        search_text = self.search_box.text()
+        if search_text.strip():
+            self.search_generation = self.search_worker.search(
+                search_text, self.note_model.notebook_id, self.note_model.tag_id)
+            self.search_count = 0
+        else:
+            self.search_worker.cancel()
+            self.search_generation = 0
+            self.load_notes()
+
+    @perf.timed("gui.show_search_results")
+    def show_search_results(self, generation, rows, finished):
+        if generation != self.search_generation:
+            return
+        titles = [(note_id, title) for note_id, title, _ in rows]
+        tooltips = {note_id: format_snippet(snippet) for note_id, _, snippet in rows}
+        if self.search_count == 0 and (rows or finished):
+            self.note_model.set_results(titles, tooltips)
+        else:
+            self.note_model.append_results(titles, tooltips)
+        self.search_count += len(rows)
+        if finished:
+            self.status_bar.showMessage(f"Found {self.search_count} notes matching '{self.search_box.text()}'", 3000)
+
+    def search_failed(self, generation, error):
+        if generation == self.search_generation:
+            self.status_bar.showMessage(f"Search failed: {error}", 5000)
 
     def toggle_fullscreen(self):
         if self.isFullScreen():
@@ -533,10 +1956,27 @@ class NestNote(QMainWindow):
         QMessageBox.information(self, "Documentation", "Documentation is under development.")
 
     def closeEvent(self, event):
-        self.conn.close()
+        self.flush_autosave()
+        self.change_timer.stop()
+        self.change_poll_timer.stop()
+        self.sync_worker.stop()
+        self.search_worker.stop()
+        self.thumbnail_worker.stop()
+        self.stop_streaming()
+        self.stop_compression()
+        if self.pdf_task and self.pdf_task.isRunning():
+            self.pdf_cancel.set()
+            self.pdf_task.wait()
+        if self.attach_task and self.attach_task.isRunning():
+            self.attach_task.wait()
+        if self.attachment_temp_dir:
+            shutil.rmtree(self.attachment_temp_dir, ignore_errors=True)
+        self.store.close()
         event.accept()
 
 if __name__ == "__main__":
+    # PDF export workers are spawned by re-running this entry point when frozen
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = NestNote()
     window.show()
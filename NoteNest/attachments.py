@@ -0,0 +1,232 @@
+"""Content-addressed storage for files attached to notes.
+
+Attached files live in a folder next to notes.db (notes.attachments for
+notes.db), one file per distinct content, named by its SHA-256 and fanned
+out over subfolders by the first two hex digits. The same file attached
+to several notes, or twice to one, is stored once.
+
+The attachments table links notes to blobs by digest and the blobs table
+counts the links, kept up to date by triggers, including when a note is
+deleted. Adding or removing an attachment is logged in note_changes
+without bumping the note's version, so other windows refresh the list but
+an edit in progress isn't treated as a conflict. Blobs whose count drops
+to zero are deleted by collect_garbage(). Files are only placed and removed while holding the database write lock,
+so another process sharing notes.db never sees a linked blob go missing.
+
+Blobs are read through mmap once they are MMAP_THRESHOLD bytes or more,
+so large attachments are paged in by the OS rather than copied into
+memory. Nothing here imports Qt.
+"""
+import hashlib
+import io
+import mmap
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+MMAP_THRESHOLD = 64 * 1024
+COPY_BLOCK_SIZE = 1024 * 1024
+# Half-written files older than this were left by a crash and can go
+STALE_TEMP_SECONDS = 24 * 60 * 60
+TEMP_PREFIX = ".incoming-"
+
+ATTACHMENTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS blobs (
+        sha256 TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS blobs_unreferenced ON blobs (sha256) WHERE refcount = 0;
+    CREATE TABLE IF NOT EXISTS attachments (
+        id INTEGER PRIMARY KEY,
+        note_id INTEGER NOT NULL,
+        sha256 TEXT NOT NULL REFERENCES blobs (sha256),
+        name TEXT NOT NULL,
+        mime_type TEXT,
+        added_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS attachments_note ON attachments (note_id);
+    CREATE INDEX IF NOT EXISTS attachments_blob ON attachments (sha256);
+    CREATE TRIGGER IF NOT EXISTS attachments_ai AFTER INSERT ON attachments BEGIN
+        UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = new.sha256;
+        INSERT INTO note_changes (note_id) VALUES (new.note_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS attachments_ad AFTER DELETE ON attachments BEGIN
+        UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = old.sha256;
+        INSERT INTO note_changes (note_id) VALUES (old.note_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_attachments_ad AFTER DELETE ON notes BEGIN
+        DELETE FROM attachments WHERE note_id = old.id;
+    END;
+"""
+
+def blob_folder(db_path):
+    """The attachment folder belonging to a database or backup file."""
+    base = os.path.abspath(db_path)
+    for suffix in (".gz", ".db"):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    return base + ".attachments"
+
+def guess_mime_type(name):
+    return mimetypes.guess_type(name)[0]
+
+class BlobStore:
+    """The files of one attachment folder, addressed by SHA-256 hex digest."""
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def path(self, digest):
+        return os.path.join(self.folder, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def stage(self, source_path, progress=None):
+        """Copy a file into the folder under a temporary name, hashing it on the way.
+
+        Returns (digest, size, temp path). place() moves the copy into place.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        total = os.path.getsize(source_path)
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=self.folder)
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with open(source_path, 'rb') as source, os.fdopen(fd, 'wb') as staged:
+                for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b""):
+                    sha.update(block)
+                    staged.write(block)
+                    size += len(block)
+                    if progress:
+                        progress(size, total)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return sha.hexdigest(), size, temp_path
+
+    def place(self, temp_path, digest):
+        """Move a staged copy to its final name, or drop it if that content is already stored."""
+        path = self.path(digest)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+
+    def open(self, digest):
+        """A read-only binary stream over a blob: an mmap when it is large, else an in-memory copy."""
+        with open(self.path(digest), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < MMAP_THRESHOLD:
+                return io.BytesIO(f.read())
+            # The mapping stays valid after the file is closed
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @contextmanager
+    def mapped(self, digest):
+        """The contents of a blob as a buffer: mapped when it is large, else read into memory."""
+        stream = self.open(digest)
+        try:
+            yield stream if isinstance(stream, mmap.mmap) else stream.getvalue()
+        finally:
+            stream.close()
+
+    def remove(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def copy_to(self, digest, other):
+        """Copy a blob into another BlobStore unless it already has it. Returns True if copied."""
+        target = other.path(digest)
+        if os.path.exists(target):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=os.path.dirname(target))
+        os.close(fd)
+        try:
+            shutil.copyfile(self.path(digest), temp_path)
+            os.replace(temp_path, target)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return True
+
+    def digests(self):
+        """Yield the digest of every blob file in the folder."""
+        if not os.path.isdir(self.folder):
+            return
+        for fanout in os.scandir(self.folder):
+            if fanout.is_dir() and len(fanout.name) == 2:
+                for entry in os.scandir(fanout.path):
+                    if not entry.name.startswith(TEMP_PREFIX):
+                        yield entry.name
+
+    def remove_stale_temp_files(self):
+        if not os.path.isdir(self.folder):
+            return
+        cutoff = time.time() - STALE_TEMP_SECONDS
+        for folder, _, files in os.walk(self.folder):
+            for name in files:
+                path = os.path.join(folder, name)
+                if name.startswith(TEMP_PREFIX) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+
+def add_attachment(conn, blobs, note_id, name, digest, size, temp_path):
+    """Link a staged file to a note; call inside a write transaction. Returns the attachment id.
+
+    The blobs row is written first, which takes the write lock before the
+    file is moved into place.
+    """
+    conn.execute("INSERT INTO blobs (sha256, size) VALUES (?, ?) ON CONFLICT (sha256) DO NOTHING", (digest, size))
+    blobs.place(temp_path, digest)
+    return conn.execute(
+        "INSERT INTO attachments (note_id, sha256, name, mime_type, added_at) VALUES (?, ?, ?, ?, ?)",
+        (note_id, digest, name, guess_mime_type(name), time.time()),
+    ).lastrowid
+
+def list_attachments(conn, note_id):
+    """(id, name, sha256, size, mime type) for each attachment of a note, oldest first."""
+    return conn.execute("""
+        SELECT attachments.id, attachments.name, attachments.sha256, blobs.size, attachments.mime_type
+        FROM attachments JOIN blobs USING (sha256)
+        WHERE attachments.note_id = ?
+        ORDER BY attachments.id
+    """, (note_id,)).fetchall()
+
+def collect_garbage(conn, blobs, sweep=False):
+    """Delete blobs no attachment links to any more; call inside a write transaction.
+
+    With sweep, files in the folder that the database doesn't know about
+    (left by a crash between placing a file and committing) and stale
+    temporary files are removed too. Returns the number of files removed.
+    """
+    removed = 0
+    unreferenced = [digest for digest, in conn.execute("SELECT sha256 FROM blobs WHERE refcount = 0")]
+    for digest in unreferenced:
+        # Conditional, in case another process linked it again since the select
+        if conn.execute("DELETE FROM blobs WHERE sha256 = ? AND refcount = 0", (digest,)).rowcount:
+            blobs.remove(digest)
+            removed += 1
+    if sweep:
+        # Any write takes the lock, so no file can be placed while sweeping
+        conn.execute("DELETE FROM blobs WHERE 0")
+        known = {digest for digest, in conn.execute("SELECT sha256 FROM blobs")}
+        for digest in list(blobs.digests()):
+            if digest not in known:
+                blobs.remove(digest)
+                removed += 1
+        blobs.remove_stale_temp_files()
+    return removed
+
+def blob_stats(conn):
+    """(attachments, distinct blobs, bytes stored)."""
+    attachments = conn.execute("SELECT COUNT(*) FROM attachments").fetchone()[0]
+    count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+    return attachments, count, size
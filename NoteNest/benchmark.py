@@ -0,0 +1,364 @@
+"""Reproducible performance benchmarks for NoteNest.
+
+    python benchmark.py [--sizes 1000,10000,100000,1000000] [--output bench.json]
+                        [--compare baseline.json] [--repeat N] [--workdir DIR]
+
+For each size a synthetic notes.db is generated from a fixed seed and kept
+in --workdir, so later runs (and other checkouts) reuse the same data. Each
+run works on a scratch copy opened in a real NestNote window on the
+offscreen Qt platform, and the GUI operations are timed through the
+window's own methods. Notes are spread over notebooks and tagged, with
+tags from common to rare, so the filtered and sorted note lists can be
+timed too. Backup and sync are timed against the store, with
+sync uploading to a LocalDriveService folder instead of Google Drive.
+
+Results are written as JSON. --compare prints the change in median time
+against an earlier results file, so a change can be measured before and
+after.
+"""
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from drive_sync import DriveSyncer, LocalDriveService
+from notebooks import SORT_CREATED, SORT_MODIFIED, SORT_TITLE
+from notestore import NoteStore, search_notes
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_REPEAT = 5
+DEFAULT_SEED = 1234
+# Bump when the generated data changes, so cached databases are rebuilt
+GENERATOR_VERSION = 2
+GENERATE_BATCH_SIZE = 5000
+SYNC_SAMPLE = 500
+
+# Synthetic notes: sentences drawn from a fixed pool. A few notes are long
+# enough to be stored compressed; RARE_WORD and PHRASE give selective queries.
+VOCABULARY_SIZE = 5000
+SENTENCE_POOL_SIZE = 2000
+COMMON_WORDS = ("note", "project", "meeting", "idea", "task", "review", "draft", "plan")
+RARE_WORD = "zqxvelt"
+RARE_EVERY = 1000
+PHRASE = "quarterly report"
+PHRASE_EVERY = 100
+SEARCHES = {
+    "common": "meeting",
+    "two_terms": "project idea",
+    "prefix": "revi*",
+    "phrase": f'"{PHRASE}"',
+    "rare": RARE_WORD,
+}
+
+# Organisation: notes are spread evenly over the notebooks, each tag is on
+# its share of the notes, and modified times are spread over a year
+NOTEBOOK_COUNT = 20
+TAG_SHARES = (("common", 0.3), ("frequent", 0.1), ("occasional", 0.03), ("uncommon", 0.01), ("rare", 0.001))
+MODIFIED_SPREAD = 365 * 24 * 60 * 60
+# (sort, notebook id, tag id) of each note list view; ids follow creation order
+LIST_VIEWS = {
+    "created": (SORT_CREATED, None, None),
+    "modified": (SORT_MODIFIED, None, None),
+    "title": (SORT_TITLE, None, None),
+    "notebook:modified": (SORT_MODIFIED, 1, None),
+    "tag_common:modified": (SORT_MODIFIED, None, 1),
+    "tag_uncommon:modified": (SORT_MODIFIED, None, 4),
+    "tag_rare:title": (SORT_TITLE, None, 5),
+    "notebook+tag:created": (SORT_CREATED, 1, 2),
+}
+LIST_PAGES = 10
+
+def make_word(rng):
+    return "".join(rng.choice("abcdefghijklmnoprstuvw") for _ in range(rng.randint(3, 9)))
+
+def generate_notes(count, seed):
+    """Yield count (title, content) pairs, the same ones for the same seed."""
+    rng = random.Random(seed)
+    vocabulary = [make_word(rng) for _ in range(VOCABULARY_SIZE)]
+    sentences = []
+    for _ in range(SENTENCE_POOL_SIZE):
+        words = rng.choices(vocabulary, k=rng.randint(5, 14))
+        words.insert(rng.randrange(len(words)), rng.choice(COMMON_WORDS))
+        sentences.append(" ".join(words).capitalize() + ".")
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.005:
+            length = rng.randint(200, 2000)
+        elif roll < 0.03:
+            length = rng.randint(20, 200)
+        else:
+            length = rng.randint(2, 10)
+        body = rng.choices(sentences, k=length)
+        if i % RARE_EVERY == 0:
+            body.append(RARE_WORD)
+        if i % PHRASE_EVERY == 0:
+            body.append(f"See the {PHRASE}.")
+        title = f"Note {i:07d} {rng.choice(vocabulary)}"
+        yield title, title + "\n" + "\n".join(" ".join(body[j:j + 4]) for j in range(0, len(body), 4))
+
+def organize_notes(store, count, seed):
+    """File and tag the count generated notes, the same way for the same seed."""
+    rng = random.Random(seed)
+    now = time.time()
+    with store.write() as conn:
+        conn.executemany("INSERT INTO notebooks (name) VALUES (?)",
+                         [(f"Notebook {i + 1}",) for i in range(NOTEBOOK_COUNT)])
+        conn.executemany("INSERT INTO tags (name) VALUES (?)", [(name,) for name, _ in TAG_SHARES])
+    for start in range(1, count + 1, GENERATE_BATCH_SIZE):
+        ids = range(start, min(start + GENERATE_BATCH_SIZE, count + 1))
+        with store.write() as conn:
+            conn.executemany("UPDATE notes SET notebook_id = ?, modified_at = ? WHERE id = ?", [
+                (rng.randint(1, NOTEBOOK_COUNT), now - rng.random() * MODIFIED_SPREAD, note_id) for note_id in ids
+            ])
+            conn.executemany("INSERT INTO note_tags (tag_id, note_id) VALUES (?, ?)", [
+                (tag_id, note_id)
+                for note_id in ids
+                for tag_id, (_, share) in enumerate(TAG_SHARES, 1) if rng.random() < share
+            ])
+
+def dataset_path(workdir, size, seed):
+    """Path of the generated database for size, generating it first if needed."""
+    path = os.path.join(workdir, f"bench-{size}-s{seed}-v{GENERATOR_VERSION}.db")
+    if os.path.exists(path):
+        return path
+    os.makedirs(workdir, exist_ok=True)
+    print(f"generating {size} notes...", file=sys.stderr)
+    temp_path = path + ".part"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(temp_path + suffix):
+            os.remove(temp_path + suffix)
+    store = NoteStore(temp_path)
+    try:
+        store.import_notes(generate_notes(size, seed), GENERATE_BATCH_SIZE)
+        organize_notes(store, size, seed)
+        # What the app would do on first launch, so it doesn't run mid-benchmark
+        store.compress_notes()
+    finally:
+        store.close()
+    os.replace(temp_path, path)
+    return path
+
+def measure(results, size, operation, func, repeat, items=None):
+    """Time func() repeat times and append a result row."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    row = {
+        "notes": size,
+        "operation": operation,
+        "runs": repeat,
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "max_ms": round(max(times), 3),
+    }
+    if items is not None:
+        row["items"] = items
+    results.append(row)
+    print(f"{size:>8} {operation:<40} {row['median_ms']:>10.1f} ms", file=sys.stderr)
+
+def bench_window(app, results, size, repeat, rng):
+    """Time the GUI operations through a NestNote window opened on notes.db in the current folder."""
+    import NoteNest
+
+    window = None
+
+    def open_window():
+        nonlocal window
+        window = NoteNest.NestNote()
+        window.note_model.fetchMore()
+
+    measure(results, size, "open_window", open_window, 1)
+    try:
+        def load_notes():
+            window.load_notes()
+            window.note_model.fetchMore()
+
+        measure(results, size, "load_notes", load_notes, repeat)
+        measure(results, size, "load_all_titles", window.note_model.all_rows, 1)
+
+        model = window.note_model
+        for label, view in LIST_VIEWS.items():
+            model.set_view(*view)
+
+            def first_page():
+                model.reload()
+                model.fetchMore()
+
+            def scroll():
+                model.reload()
+                for _ in range(LIST_PAGES):
+                    model.fetchMore()
+
+            measure(results, size, f"list_notes:{label}", first_page, repeat)
+            measure(results, size, f"list_notes:{label}:{LIST_PAGES}_pages", scroll, repeat)
+        model.set_view(SORT_CREATED, None, None)
+        load_notes()
+
+        with window.store.read() as conn:
+            for label, query in SEARCHES.items():
+                measure(results, size, f"search_notes:{label}",
+                        lambda: search_notes(conn, query, NoteNest.SEARCH_RESULT_LIMIT).fetchall(), repeat)
+
+        rows = window.note_model.rowCount()
+
+        def select(row):
+            window.note_list.setCurrentIndex(window.note_model.index(row))
+            window.load_selected_note()
+
+        def load_cold():
+            window.doc_cache.clear()
+            window.new_note()
+            select(rng.randrange(rows))
+
+        measure(results, size, "load_selected_note", load_cold, repeat)
+        pair = rng.sample(range(rows), 2)
+        select(pair[0])
+        select(pair[1])
+
+        def load_cached():
+            # Alternate between two notes, both in the document cache
+            pair.reverse()
+            select(pair[1])
+
+        measure(results, size, "load_selected_note:cached", load_cached, repeat)
+
+        def save_edit():
+            select(rng.randrange(rows))
+            window.text_editor.append(f"Edited at {time.perf_counter()}")
+            window.write_note(autosave=False)
+
+        measure(results, size, "save_note:edit", save_edit, repeat)
+        counter = iter(range(sys.maxsize))
+
+        def save_new():
+            window.new_note()
+            window.text_editor.setPlainText(f"Benchmark note {next(counter)}\n" + "New text. " * 50)
+            window.write_note(autosave=False)
+
+        measure(results, size, "save_note:new", save_new, repeat)
+    finally:
+        if window:
+            window.close()
+            app.processEvents()
+
+def bench_store(results, size, scratch):
+    """Time backup and Drive sync against the store in the current folder."""
+    store = NoteStore("notes.db")
+    try:
+        backup_path = os.path.join(scratch, "backup.db")
+        measure(results, size, "backup_notes", lambda: store.backup(backup_path), 1)
+        measure(results, size, "backup_notes:compressed", lambda: store.backup(backup_path + ".gz", compress=True), 1)
+
+        drive = os.path.join(scratch, "drive")
+        syncer = DriveSyncer(store.connect, lambda: LocalDriveService(drive), blobs=store.blobs)
+        sample = min(SYNC_SAMPLE, size)
+
+        def queue_sample():
+            with store.write() as conn:
+                conn.execute("INSERT INTO sync_outbox (note_id) SELECT id FROM notes ORDER BY id LIMIT ?", (sample,))
+
+        queue_sample()
+        measure(results, size, "sync", syncer.run_due, 1, items=sample)
+        queue_sample()
+        measure(results, size, "sync:unchanged", syncer.run_due, 1, items=sample)
+    finally:
+        store.close()
+
+def environment(seed):
+    from PyQt6.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+    from compression import zstandard
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "qt": QT_VERSION_STR,
+        "pyqt": PYQT_VERSION_STR,
+        "zstd": zstandard is not None,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+        "generator_version": GENERATOR_VERSION,
+    }
+
+def compare(baseline_path, results):
+    """Print the change in median time of each operation against a baseline file."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(row["notes"], row["operation"]): row for row in json.load(f)["results"]}
+    print(f"{'notes':>8} {'operation':<40} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for row in results:
+        before = baseline.get((row["notes"], row["operation"]))
+        if before is None:
+            continue
+        change = (row["median_ms"] - before["median_ms"]) / before["median_ms"] * 100 if before["median_ms"] else 0
+        print(f"{row['notes']:>8} {row['operation']:<40} {before['median_ms']:>10.1f} {row['median_ms']:>10.1f}"
+              f" {change:>+7.1f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark NoteNest on synthetic databases.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated note counts (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs per timed operation")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "notenest-bench"),
+                        help="where generated databases are kept (default: %(default)s)")
+    parser.add_argument("--output", default="benchmark.json", help="results file, '-' for stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    from PyQt6.QtWidgets import QApplication, QMessageBox
+
+    app = QApplication.instance() or QApplication([])
+    # Nothing may block on a modal dialog offscreen
+    for name in ("warning", "information", "critical"):
+        setattr(QMessageBox, name, staticmethod(lambda parent, title, text, *rest: print(title, text, file=sys.stderr)))
+
+    workdir = os.path.abspath(args.workdir)
+    results = []
+    start_dir = os.getcwd()
+    rng = random.Random(args.seed)
+    for size in sizes:
+        source = dataset_path(workdir, size, args.seed)
+        scratch = tempfile.mkdtemp(prefix=f"run-{size}-", dir=workdir)
+        try:
+            shutil.copyfile(source, os.path.join(scratch, "notes.db"))
+            os.chdir(scratch)
+            os.environ["NOTENEST_DRIVE_DIR"] = os.path.join(scratch, "window-drive")
+            bench_window(app, results, size, args.repeat, rng)
+            bench_store(results, size, scratch)
+        finally:
+            os.chdir(start_dir)
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    report = {"environment": environment(args.seed), "results": results}
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Change tracking, so several processes can share notes.db.
+
+Every note has a version, bumped by each save. Saves pass the version
+they started from and fail if the note has moved on since, instead of
+silently overwriting another window's edit. Writers that don't set the
+version themselves, such as a script updating notes directly, get it
+bumped by a trigger when the title or text actually changed.
+
+Every insert, version bump and delete also appends the note's id to
+note_changes. Another process remembers the last seq it has seen and
+asks for the notes changed since, so it only refreshes those. The log is
+pruned to its newest CHANGE_LOG_KEEP entries; a reader that fell further
+behind than that is told to reload everything.
+"""
+
+CHANGE_LOG_KEEP = 10000
+
+# Whether an UPDATE changed a note's title or text. Compressed bodies can't
+# be read in plain SQL, but compress_notes() only ever turns a text body
+# into a blob holding the same text.
+TEXT_CHANGED = """(
+    new.title IS NOT old.title OR new.chunked IS NOT old.chunked
+    OR (new.content IS NOT old.content AND NOT (typeof(old.content) = 'text' AND typeof(new.content) = 'blob'))
+)"""
+
+CHANGES_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS note_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        note_id INTEGER NOT NULL
+    );
+    CREATE TRIGGER IF NOT EXISTS notes_version_au AFTER UPDATE OF title, content, chunked ON notes
+    WHEN new.version = old.version AND {TEXT_CHANGED} BEGIN
+        UPDATE notes SET version = old.version + 1 WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_changes_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO note_changes (note_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_changes_au AFTER UPDATE OF version ON notes
+    WHEN new.version IS NOT old.version BEGIN
+        INSERT INTO note_changes (note_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_changes_ad AFTER DELETE ON notes BEGIN
+        INSERT INTO note_changes (note_id) VALUES (old.id);
+    END;
+"""
+
+def last_change(conn):
+    """The seq of the newest change, 0 if there are none."""
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM note_changes").fetchone()[0]
+
+def changes_since(conn, seq):
+    """(last seq, [(id, title, version)]) for the notes changed after seq.
+
+    A deleted note comes back with a title and version of None. Returns
+    (last seq, None) if the log no longer reaches back to seq, in which
+    case everything should be reloaded.
+    """
+    last, oldest = conn.execute("SELECT COALESCE(MAX(seq), 0), MIN(seq) FROM note_changes").fetchone()
+    if last == seq:
+        return last, []
+    # Behind the pruned log, or the database was replaced, e.g. by a restore
+    if last < seq or oldest > seq + 1:
+        return last, None
+    rows = conn.execute("""
+        SELECT changed.note_id, notes.title, notes.version
+        FROM (SELECT DISTINCT note_id FROM note_changes WHERE seq > ? AND seq <= ?) AS changed
+        LEFT JOIN notes ON notes.id = changed.note_id
+        ORDER BY changed.note_id
+    """, (seq, last)).fetchall()
+    return last, rows
+
+def prune_changes(conn, keep=CHANGE_LOG_KEEP):
+    conn.execute("DELETE FROM note_changes WHERE seq <= (SELECT MAX(seq) FROM note_changes) - ?", (keep,))
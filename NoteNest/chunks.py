@@ -0,0 +1,110 @@
+"""Chunked storage for very large notes.
+
+A note of LARGE_NOTE_CHARS characters or more keeps its body in note_chunks
+instead of notes.content, split at line ends into pieces of roughly
+CHUNK_MIN_CHARS to CHUNK_MAX_CHARS. Boundaries are content-defined: a chunk
+ends after a line whose crc32 hits 1 in CHUNK_BOUNDARY_ODDS, so an edit only
+moves the boundaries near it. Saving the note then rewrites just the chunks
+whose digest changed; the others are kept, renumbered if need be.
+
+Chunk ids are negative, so each chunk can be its own row in the full-text
+index next to the notes, and only changed chunks are reindexed; note rows
+are indexed by NoteStore (see fulltext.py). Chunked
+notes keep no revision history.
+"""
+import zlib
+
+from compression import decode_content, encode_content
+from fulltext import index_row, unindex_chunks, unindex_row
+from revisions import revision_digest
+
+LARGE_NOTE_CHARS = 1024 * 1024
+# A chunked note only goes back to a single row once it shrinks below this
+SMALL_NOTE_CHARS = LARGE_NOTE_CHARS // 2
+CHUNK_MIN_CHARS = 64 * 1024
+CHUNK_MAX_CHARS = 512 * 1024
+CHUNK_BOUNDARY_ODDS = 1024
+
+CHUNKS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS note_chunks (
+        id INTEGER PRIMARY KEY,
+        note_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        digest BLOB NOT NULL,
+        content
+    );
+    CREATE INDEX IF NOT EXISTS note_chunks_note ON note_chunks (note_id, seq);
+    CREATE TRIGGER IF NOT EXISTS notes_chunks_ad AFTER DELETE ON notes BEGIN
+        DELETE FROM note_chunks WHERE note_id = old.id;
+    END;
+"""
+
+def split_chunks(text):
+    """Split text into chunks ending at content-defined line ends."""
+    chunks = []
+    start = pos = 0
+    while pos < len(text):
+        end = text.find("\n", pos)
+        end = len(text) if end < 0 else end + 1
+        if end - start > CHUNK_MAX_CHARS:
+            # Cut long lines, boundary or not
+            end = start + CHUNK_MAX_CHARS
+            chunks.append(text[start:end])
+            start = pos = end
+            continue
+        line, pos = text[pos:end], end
+        if end - start >= CHUNK_MIN_CHARS and zlib.crc32(line.encode('utf-8')) % CHUNK_BOUNDARY_ODDS == 0:
+            chunks.append(text[start:end])
+            start = end
+    if start < len(text):
+        chunks.append(text[start:])
+    return chunks
+
+def write_chunks(conn, note_id, text):
+    """Store text as the chunks of note_id, writing only chunks not already stored.
+
+    Returns the number of chunks written.
+    """
+    unused = {}
+    for chunk_id, seq, digest in conn.execute(
+        "SELECT id, seq, digest FROM note_chunks WHERE note_id = ?", (note_id,)
+    ):
+        unused.setdefault(digest, []).append((chunk_id, seq))
+    next_id = min(conn.execute("SELECT MIN(id) FROM note_chunks").fetchone()[0] or 0, 0)
+    written = 0
+    for seq, piece in enumerate(split_chunks(text)):
+        digest = revision_digest(piece)
+        if unused.get(digest):
+            chunk_id, old_seq = unused[digest].pop()
+            if old_seq != seq:
+                conn.execute("UPDATE note_chunks SET seq = ? WHERE id = ?", (seq, chunk_id))
+            continue
+        next_id -= 1
+        conn.execute(
+            "INSERT INTO note_chunks (id, note_id, seq, size, digest, content) VALUES (?, ?, ?, ?, ?, ?)",
+            (next_id, note_id, seq, len(piece.encode('utf-8')), digest, encode_content(piece)),
+        )
+        index_row(conn, next_id, None, piece)
+        written += 1
+    for chunks in unused.values():
+        for chunk_id, _ in chunks:
+            unindex_row(conn, chunk_id)
+            conn.execute("DELETE FROM note_chunks WHERE id = ?", (chunk_id,))
+    return written
+
+def delete_chunks(conn, note_id):
+    """Delete the chunks of note_id and their index rows."""
+    unindex_chunks(conn, note_id)
+    conn.execute("DELETE FROM note_chunks WHERE note_id = ?", (note_id,))
+
+def chunk_count(conn, note_id):
+    return conn.execute("SELECT COUNT(*) FROM note_chunks WHERE note_id = ?", (note_id,)).fetchone()[0]
+
+def read_chunk(conn, note_id, seq):
+    row = conn.execute("SELECT content FROM note_chunks WHERE note_id = ? AND seq = ?", (note_id, seq)).fetchone()
+    return decode_content(row[0]) if row else None
+
+def read_chunks(conn, note_id):
+    rows = conn.execute("SELECT content FROM note_chunks WHERE note_id = ? ORDER BY seq", (note_id,))
+    return "".join(decode_content(content) for content, in rows)
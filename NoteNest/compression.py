@@ -0,0 +1,163 @@
+"""Transparent compression of large note bodies.
+
+A body of COMPRESS_THRESHOLD bytes or more is stored as a BLOB that starts
+with a small header: MAGIC, a codec byte and the uncompressed size. Smaller
+bodies, and ones that don't shrink enough, stay plain TEXT, so the column
+type alone tells the two apart. zstd is used when the zstandard package is
+installed and zlib otherwise; notes are always read back with whichever
+codec wrote them.
+
+Connections register nn_text(), so SQL (and the full-text index) can see
+the decompressed text.
+"""
+import io
+import os
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESS_THRESHOLD = 8 * 1024
+# Keep the compressed form only when it is at most this fraction of the text
+MAX_RATIO = 0.9
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+READ_BLOCK_SIZE = 16 * 1024
+
+MAGIC = b"NN"
+ZLIB = b"z"
+ZSTD = b"s"
+HEADER = struct.Struct("<2scQ")
+
+def compress(data):
+    if zstandard is not None:
+        return ZSTD, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return ZLIB, zlib.compress(data, ZLIB_LEVEL)
+
+def decompressor(codec):
+    """A decompressobj-style object for codec."""
+    if codec == ZLIB:
+        return zlib.decompressobj()
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ValueError("This note is compressed with zstd; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unknown note compression codec {codec!r}")
+
+def read_header(value):
+    """(codec, size) from a stored body's header; raises ValueError if it has none."""
+    if len(value) < HEADER.size:
+        raise ValueError("Stored note is too short to be compressed")
+    magic, codec, size = HEADER.unpack_from(value)
+    if magic != MAGIC:
+        raise ValueError("Stored note has no compression header")
+    return codec, size
+
+def encode_content(text):
+    """The value to store for a note body: the text itself or a compressed BLOB."""
+    if text is None:
+        return None
+    data = text.encode('utf-8')
+    if len(data) < COMPRESS_THRESHOLD:
+        return text
+    codec, packed = compress(data)
+    if HEADER.size + len(packed) > len(data) * MAX_RATIO:
+        return text
+    return HEADER.pack(MAGIC, codec, len(data)) + packed
+
+def decode_content(value):
+    """The note text for a stored value, as written by encode_content."""
+    if not isinstance(value, bytes):
+        return value
+    codec, _ = read_header(value)
+    engine = decompressor(codec)
+    data = engine.decompress(value[HEADER.size:]) + engine.flush()
+    return data.decode('utf-8')
+
+def content_size(value):
+    """Size in bytes of a stored value once decoded to UTF-8."""
+    if value is None:
+        return 0
+    if isinstance(value, bytes):
+        return read_header(value)[1]
+    return len(value.encode('utf-8'))
+
+def register_functions(conn):
+    conn.create_function("nn_text", 1, decode_content, deterministic=True)
+
+class DecodedStream(io.IOBase):
+    """Read-only binary stream of the UTF-8 text inside a compressed body.
+
+    raw is a seekable stream over the stored BLOB, such as an incremental
+    blob handle. Data is decompressed READ_BLOCK_SIZE at a time as it is
+    read. The size is known from the header, so seeking to the end is free;
+    seeking backwards starts decompressing again from the beginning.
+    """
+
+    def __init__(self, raw):
+        super().__init__()
+        self.raw = raw
+        self.codec, self.size = read_header(raw.read(HEADER.size))
+        self.position = 0
+        self.restart()
+
+    def restart(self):
+        self.raw.seek(HEADER.size)
+        self.engine = decompressor(self.codec)
+        self.decoded = 0
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.position = offset
+        return offset
+
+    def fill(self, wanted):
+        """Decompress until `wanted` bytes past self.decoded are pending, or the data ends."""
+        while len(self.pending) < wanted:
+            block = self.raw.read(READ_BLOCK_SIZE)
+            if not block:
+                self.pending += self.engine.flush()
+                break
+            self.pending += self.engine.decompress(block)
+
+    def take(self, n):
+        data, self.pending = self.pending[:n], self.pending[n:]
+        self.decoded += len(data)
+        return data
+
+    def read(self, n=-1):
+        if self.position < self.decoded:
+            self.restart()
+        while self.decoded < self.position:
+            self.fill(min(self.position - self.decoded, READ_BLOCK_SIZE))
+            if not self.take(self.position - self.decoded):
+                break
+        if n is None or n < 0:
+            n = max(0, self.size - self.position)
+        self.fill(n)
+        data = self.take(n)
+        self.position += len(data)
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.raw.close()
+        super().close()
@@ -0,0 +1,506 @@
+"""Google Drive sync for NoteNest.
+
+Notes waiting to be uploaded are queued in the sync_outbox table of notes.db,
+so a sync survives restarts and network failures. NoteStore creates the
+sync tables with the rest of its schema. DriveSyncer drains that queue
+with a single authenticated Drive service and retries failed uploads with
+exponential backoff.
+
+The drive_files table remembers the Drive file, name, content hash and
+note version last uploaded for each note id. Unchanged notes are never
+uploaded again, and changed or renamed ones update and rename their
+existing Drive file instead of creating a duplicate. A note still at the
+version last synced isn't even read when looking for changes.
+
+Note bodies are streamed to Drive straight out of SQLite with resumable,
+chunked uploads, so memory use stays bounded by UPLOAD_CHUNK_SIZE however
+large the note is.
+
+Attachments are uploaded after their note, one Drive file per distinct
+content named by its SHA-256. drive_blobs remembers which blobs Drive
+already has, so a file attached to many notes is transferred once.
+
+The Google client libraries are slow to import, so they are only imported
+the first time something is actually synced.
+"""
+import hashlib
+import io
+from bisect import bisect_right
+import json
+import os
+import pickle
+import random
+import time
+import uuid
+
+from compression import DecodedStream, decode_content
+from perf import timed
+
+# Google Drive authentication and service setup
+SCOPES = ['https://www.googleapis.com/auth/drive.file']
+CREDS = None
+
+# Retry policy for queued uploads
+MAX_ATTEMPTS = 8
+BASE_DELAY = 2.0
+MAX_DELAY = 300.0
+
+# Notes queued per insert batch
+BATCH_SIZE = 200
+
+# Drive wants resumable chunks in multiples of 256 KB
+UPLOAD_CHUNK_SIZE = 4 * 256 * 1024
+HASH_BLOCK_SIZE = 64 * 1024
+
+OUTBOX_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sync_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        note_id INTEGER NOT NULL,
+        title TEXT,
+        content TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt REAL NOT NULL DEFAULT 0,
+        last_error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS sync_outbox_note ON sync_outbox (note_id);
+    CREATE TABLE IF NOT EXISTS drive_files (
+        note_id INTEGER PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        version INTEGER,
+        synced_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS drive_blobs (
+        sha256 TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        synced_at REAL NOT NULL
+    );
+"""
+
+@timed("drive.authenticate")
+def authenticate_google_drive():
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
+    from google.auth.transport.requests import Request
+
+    global CREDS
+    if os.path.exists('token.pickle'):
+        with open('token.pickle', 'rb') as token:
+            CREDS = pickle.load(token)
+    if not CREDS or not CREDS.valid:
+        if CREDS and CREDS.expired and CREDS.refresh_token:
+            CREDS.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+            CREDS = flow.run_local_server(port=0)
+        with open('token.pickle', 'wb') as token:
+            pickle.dump(CREDS, token)
+
+    try:
+        service = build('drive', 'v3', credentials=CREDS)
+        return service
+    except HttpError as error:
+        print(f'An error occurred: {error}')
+
+@timed("drive.upload_note")
+def upload_note(service, title, stream, file_id=None, mimetype='application/text'):
+    """Upload a note body from a seekable binary stream as a Drive file named after its title.
+
+    An existing file_id is updated in place and given the title as its
+    name. Returns the Drive file resource with its id and version.
+    """
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaIoBaseUpload
+
+    media = MediaIoBaseUpload(stream, mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    if file_id:
+        try:
+            return send_upload(service.files().update(fileId=file_id, body={'name': title}, media_body=media,
+                                                      fields='id,version'))
+        except HttpError as error:
+            # The file was removed on Drive; upload it again as a new one
+            if error.resp.status != 404:
+                raise
+    return send_upload(service.files().create(body={'name': title}, media_body=media, fields='id,version'))
+
+def send_upload(request):
+    response = None
+    while response is None:
+        _, response = request.next_chunk()
+    return response
+
+def open_content(conn, table, rowid):
+    """Open the content column of a row as a read-only binary stream.
+
+    Uses incremental blob I/O where available, so the body is never loaded
+    into memory as a whole. Compressed bodies are decompressed as they are
+    read, and chunked notes are read chunk after chunk, so the stream always
+    holds the note's UTF-8 text.
+    """
+    if table == "notes" and conn.execute("SELECT chunked FROM notes WHERE id = ?", (rowid,)).fetchone() == (1,):
+        return ChunkedContent(conn, rowid)
+    row = conn.execute(f"SELECT typeof(content) FROM {table} WHERE rowid = ?", (rowid,)).fetchone()
+    if row is None or row[0] == "null":
+        return io.BytesIO(b"")
+    if hasattr(conn, "blobopen"):
+        blob = conn.blobopen(table, "content", rowid, readonly=True)
+        return DecodedStream(blob) if row[0] == "blob" else blob
+    content = conn.execute(f"SELECT content FROM {table} WHERE rowid = ?", (rowid,)).fetchone()[0]
+    return io.BytesIO(decode_content(content).encode('utf-8'))
+
+class ChunkedContent(io.IOBase):
+    """Read-only binary stream over the chunks of a chunked note, in order.
+
+    Chunk sizes are stored, so the total size and the chunk holding any
+    offset are known without reading the chunks. Only one chunk is open at
+    a time.
+    """
+
+    def __init__(self, conn, note_id):
+        super().__init__()
+        self.conn = conn
+        self.chunk_ids = []
+        self.offsets = []
+        self.size = 0
+        for chunk_id, size in conn.execute(
+            "SELECT id, size FROM note_chunks WHERE note_id = ? ORDER BY seq", (note_id,)
+        ):
+            self.chunk_ids.append(chunk_id)
+            self.offsets.append(self.size)
+            self.size += size
+        self.position = 0
+        self.current = None
+        self.current_index = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.position = offset
+        return offset
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = max(0, self.size - self.position)
+        parts = []
+        while n > 0 and self.position < self.size:
+            index = bisect_right(self.offsets, self.position) - 1
+            if index != self.current_index:
+                if self.current:
+                    self.current.close()
+                self.current = open_content(self.conn, "note_chunks", self.chunk_ids[index])
+                self.current_index = index
+            start = self.offsets[index]
+            end = self.offsets[index + 1] if index + 1 < len(self.offsets) else self.size
+            self.current.seek(self.position - start)
+            data = self.current.read(min(n, end - self.position))
+            if not data:
+                break
+            parts.append(data)
+            self.position += len(data)
+            n -= len(data)
+        return b"".join(parts)
+
+    def close(self):
+        if not self.closed and self.current:
+            self.current.close()
+        super().close()
+
+def stream_hash(stream):
+    """sha256 of a stream's contents, leaving the stream rewound."""
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def drive_service_factory():
+    """Return the callable used to build the Drive service.
+
+    Setting NOTENEST_DRIVE_DIR swaps Google Drive for a LocalDriveService
+    writing into that folder, which is handy for testing sync offline.
+    """
+    folder = os.environ.get("NOTENEST_DRIVE_DIR")
+    if folder:
+        return lambda: LocalDriveService(folder)
+    return authenticate_google_drive
+
+def enqueue_upload(conn, note_id, title, content):
+    """Queue a snapshot of a note's title and text for upload by the sync worker."""
+    conn.execute("INSERT INTO sync_outbox (note_id, title, content) VALUES (?, ?, ?)", (note_id, title, content))
+    conn.commit()
+
+def queue_changed_notes(conn, batch_size=BATCH_SIZE, attachments=False):
+    """Queue every saved note whose title or content differs from what was last synced.
+
+    Notes still at the version last synced are skipped unread, the others
+    are hashed. With attachments, notes with an attachment Drive doesn't
+    have yet are queued too. Entries are queued without a content
+    snapshot, so the worker uploads whatever is saved when it gets to
+    them. The notes are all checked before anything is written, then
+    queued batch_size at a time with a commit after each batch, so a save
+    never waits for the scan. Returns the number queued.
+    """
+    changed = []
+    rows = conn.execute("""
+        SELECT notes.id, drive_files.content_hash, drive_files.name IS NOT notes.title,
+               drive_files.version IS notes.version, ? AND EXISTS (
+            SELECT 1 FROM attachments LEFT JOIN drive_blobs USING (sha256)
+            WHERE attachments.note_id = notes.id AND drive_blobs.sha256 IS NULL
+        )
+        FROM notes LEFT JOIN drive_files ON drive_files.note_id = notes.id
+        WHERE NOT EXISTS (SELECT 1 FROM sync_outbox WHERE sync_outbox.note_id = notes.id AND content IS NULL)
+    """, (attachments,))
+    for note_id, synced_hash, renamed, same_version, blobs_pending in rows:
+        if synced_hash is not None and not renamed and not blobs_pending:
+            if same_version:
+                continue
+            with open_content(conn, "notes", note_id) as stream:
+                if stream_hash(stream) == synced_hash:
+                    continue
+        changed.append((note_id, note_id))
+    queued = 0
+    for start in range(0, len(changed), batch_size):
+        # Skips notes queued by someone else since the scan
+        queued += conn.executemany("""
+            INSERT INTO sync_outbox (note_id) SELECT ?
+            WHERE NOT EXISTS (SELECT 1 FROM sync_outbox WHERE note_id = ? AND content IS NULL)
+        """, changed[start:start + batch_size]).rowcount
+        conn.commit()
+    return queued
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts."""
+    delay = min(MAX_DELAY, BASE_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+class DriveSyncer:
+    """Uploads the notes queued in sync_outbox.
+
+    The Drive service is built on first use and then reused for every
+    upload. A fresh SQLite connection is opened with open_connection() for
+    each pass, so the syncer can run on any thread and never holds notes.db
+    open while idle.
+    """
+
+    def __init__(self, open_connection, service_factory=None, max_attempts=MAX_ATTEMPTS, blobs=None):
+        self.open_connection = open_connection
+        self.service_factory = service_factory or drive_service_factory()
+        self.max_attempts = max_attempts
+        # Attachments are only synced when given the BlobStore holding them
+        self.blobs = blobs
+        self._service = None
+
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = self.service_factory()
+        return self._service
+
+    def seconds_until_due(self):
+        """Seconds until the next queued upload is due, or None if the queue is empty."""
+        conn = self.open_connection()
+        try:
+            next_attempt = conn.execute(
+                "SELECT MIN(next_attempt) FROM sync_outbox WHERE attempts < ?", (self.max_attempts,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        if next_attempt is None:
+            return None
+        return max(0.0, next_attempt - time.time())
+
+    def queue_changed(self):
+        conn = self.open_connection()
+        try:
+            return queue_changed_notes(conn, attachments=self.blobs is not None)
+        finally:
+            conn.close()
+
+    @timed("drive.sync_entry")
+    def sync_entry(self, conn, entry_id, note_id, title, has_snapshot):
+        """Upload one outbox entry unless Drive already has this content under this title.
+
+        Entries with a snapshot upload the queued text, the others upload
+        the note as currently saved. A renamed note keeps its Drive file,
+        which is renamed by the upload. Attachments Drive doesn't have yet
+        follow. Returns the Drive file id, or None if the note no longer
+        exists.
+        """
+        version = None
+        if has_snapshot:
+            table, rowid = "sync_outbox", entry_id
+        else:
+            row = conn.execute("SELECT version FROM notes WHERE id = ?", (note_id,)).fetchone()
+            if row is None:
+                return None
+            version = row[0]
+            table, rowid = "notes", note_id
+        synced = conn.execute(
+            "SELECT file_id, name, content_hash, version FROM drive_files WHERE note_id = ?", (note_id,)
+        ).fetchone()
+        file = None
+        with open_content(conn, table, rowid) as stream:
+            digest = stream_hash(stream)
+            if synced and synced[1:3] == (title, digest):
+                file_id = synced[0]
+            else:
+                file = upload_note(self.service, title, stream, synced[0] if synced else None)
+                file_id = file["id"]
+        # Only once the stream is closed: its read snapshot could not take the write lock
+        if file is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO drive_files (note_id, file_id, name, content_hash, version, synced_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (note_id, file_id, title, digest, version, time.time()),
+            )
+            conn.commit()
+        elif version is not None and synced[3] != version:
+            # Saved again without changes; the next scan can skip it unread
+            conn.execute("UPDATE drive_files SET version = ? WHERE note_id = ?", (version, note_id))
+            conn.commit()
+        self.sync_attachments(conn, note_id)
+        return file_id
+
+    @timed("drive.sync_attachments")
+    def sync_attachments(self, conn, note_id):
+        """Upload the note's attachments that Drive doesn't have, each distinct blob once."""
+        if self.blobs is None:
+            return
+        missing = conn.execute("""
+            SELECT DISTINCT attachments.sha256 FROM attachments LEFT JOIN drive_blobs USING (sha256)
+            WHERE attachments.note_id = ? AND drive_blobs.sha256 IS NULL
+        """, (note_id,)).fetchall()
+        for digest, in missing:
+            with self.blobs.open(digest) as stream:
+                file = upload_note(self.service, digest, stream, mimetype='application/octet-stream')
+            conn.execute("INSERT OR REPLACE INTO drive_blobs (sha256, file_id, synced_at) VALUES (?, ?, ?)",
+                         (digest, file["id"], time.time()))
+            conn.commit()
+
+    @timed("drive.run_due")
+    def run_due(self, on_progress=None, on_synced=None, on_failed=None, should_stop=None):
+        """Upload every queued note that is due and return how many were synced.
+
+        Each entry's outcome is committed as soon as it is known, so the
+        write lock is never held while uploading and saving a note never
+        waits on the network.
+        """
+        conn = self.open_connection()
+        synced = 0
+        try:
+            due = [row[0] for row in conn.execute(
+                "SELECT id FROM sync_outbox WHERE attempts < ? AND next_attempt <= ? ORDER BY id",
+                (self.max_attempts, time.time()),
+            )]
+            for done, entry_id in enumerate(due):
+                if should_stop and should_stop():
+                    break
+                row = conn.execute("""
+                    SELECT sync_outbox.note_id, COALESCE(sync_outbox.title, notes.title),
+                           sync_outbox.content IS NOT NULL, sync_outbox.attempts
+                    FROM sync_outbox LEFT JOIN notes ON notes.id = sync_outbox.note_id
+                    WHERE sync_outbox.id = ?
+                """, (entry_id,)).fetchone()
+                if row is None:
+                    continue
+                note_id, title, has_snapshot, attempts = row
+                try:
+                    file_id = self.sync_entry(conn, entry_id, note_id, title, has_snapshot)
+                except Exception as e:
+                    attempts += 1
+                    conn.execute(
+                        "UPDATE sync_outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                        (attempts, time.time() + retry_delay(attempts), str(e), entry_id),
+                    )
+                    conn.commit()
+                    if on_failed:
+                        on_failed(title, str(e))
+                else:
+                    conn.execute("DELETE FROM sync_outbox WHERE id = ?", (entry_id,))
+                    conn.commit()
+                    synced += 1
+                    if on_synced and file_id:
+                        on_synced(title, file_id)
+                if on_progress:
+                    on_progress(done + 1, len(due))
+        finally:
+            conn.close()
+        return synced
+
+class LocalDriveService:
+    """Minimal stand-in for the Drive v3 service that keeps files in a local folder.
+
+    Only the calls NoteNest makes are supported: files().create(...) and
+    files().update(...) followed by execute() or a next_chunk() loop.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.uploads = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def files(self):
+        return self
+
+    def create(self, body=None, media_body=None, fields=None):
+        return _LocalDriveRequest(self, None, body or {}, media_body)
+
+    def update(self, fileId, body=None, media_body=None, fields=None):
+        return _LocalDriveRequest(self, fileId, body or {}, media_body)
+
+class _LocalDriveRequest:
+    def __init__(self, service, file_id, body, media_body):
+        self.service = service
+        self.file_id = file_id
+        self.body = body
+        self.media_body = media_body
+        self.offset = 0
+        self.part_path = os.path.join(service.folder, f"{uuid.uuid4().hex}.part")
+
+    def execute(self):
+        response = None
+        while response is None:
+            _, response = self.next_chunk()
+        return response
+
+    def next_chunk(self):
+        media = self.media_body
+        if media is not None:
+            chunk = media.getbytes(self.offset, media.chunksize() if media.resumable() else media.size())
+            with open(self.part_path, 'ab') as part_file:
+                part_file.write(chunk)
+            self.offset += len(chunk)
+            if chunk and self.offset < media.size():
+                return self.offset / media.size(), None
+        return None, self.finish()
+
+    def finish(self):
+        file_id = self.file_id or uuid.uuid4().hex
+        meta_path = os.path.join(self.service.folder, f"{file_id}.json")
+        meta = {"name": None, "version": 0}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as meta_file:
+                meta = json.load(meta_file)
+        meta["name"] = self.body.get("name", meta["name"])
+        meta["version"] += 1
+        if self.media_body is not None:
+            os.replace(self.part_path, os.path.join(self.service.folder, file_id))
+            self.service.uploads += 1
+        with open(meta_path, 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+        return {"id": file_id, "version": str(meta["version"])}
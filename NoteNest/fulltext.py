@@ -0,0 +1,81 @@
+"""The full-text index over notes and their chunks.
+
+notes_fts reads through the note_segments view: one row per note
+(positive ids) holding its title and, unless the note is chunked, its
+text, plus one row per chunk (negative ids). nn_text() decompresses, so
+everything is indexed and snippeted as text.
+
+Only NoteStore connections have nn_text(), so no trigger may call it, or
+notes.db could not be written from any other SQLite client. NoteStore
+keeps the index up to date itself instead: a row is unindexed before it
+changes or goes, while the view still shows what was indexed, and indexed
+again with its new text afterwards. Compressing a body leaves its text,
+and so the index, as it is.
+
+Writes from elsewhere, such as the sqlite3 shell, are spotted by plain SQL
+triggers that mark the index stale; NoteStore rebuilds it before its next
+write. An insert is taken to come from elsewhere when it leaves created_at
+to the timestamps trigger, an update or delete when the row is still
+indexed.
+"""
+from changes import TEXT_CHANGED
+
+FTS_SCHEMA = """
+    CREATE VIEW IF NOT EXISTS note_segments AS
+        SELECT id, title, CASE WHEN chunked THEN NULL ELSE nn_text(content) END AS content FROM notes
+        UNION ALL
+        SELECT id, NULL, nn_text(content) FROM note_chunks;
+    CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        title, content, content='note_segments', content_rowid='id'
+    );
+"""
+
+FTS_DROP = """
+    DROP TABLE IF EXISTS notes_fts;
+    DROP VIEW IF EXISTS notes_text;
+    DROP VIEW IF EXISTS note_segments;
+"""
+
+# The triggers that kept the index up to date before NoteStore did
+OLD_TRIGGERS_DROP = """
+    DROP TRIGGER IF EXISTS notes_ai;
+    DROP TRIGGER IF EXISTS notes_ad;
+    DROP TRIGGER IF EXISTS notes_au;
+    DROP TRIGGER IF EXISTS note_chunks_ai;
+    DROP TRIGGER IF EXISTS note_chunks_ad;
+"""
+
+STALE_TRIGGERS = f"""
+    CREATE TRIGGER IF NOT EXISTS notes_fts_stale_ai AFTER INSERT ON notes
+    WHEN new.created_at IS NULL BEGIN
+        INSERT OR REPLACE INTO meta (key, value) VALUES ('index_stale', 1);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_fts_stale_au AFTER UPDATE OF title, content, chunked ON notes
+    WHEN {TEXT_CHANGED} AND EXISTS (SELECT 1 FROM notes_fts_docsize WHERE id = new.id) BEGIN
+        INSERT OR REPLACE INTO meta (key, value) VALUES ('index_stale', 1);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_fts_stale_ad AFTER DELETE ON notes
+    WHEN EXISTS (SELECT 1 FROM notes_fts_docsize WHERE id = old.id) BEGIN
+        INSERT OR REPLACE INTO meta (key, value) VALUES ('index_stale', 1);
+    END;
+"""
+
+def index_row(conn, rowid, title, text):
+    """Index a note (title, and text unless chunked) or a chunk (text only)."""
+    conn.execute("INSERT INTO notes_fts (rowid, title, content) VALUES (?, ?, ?)", (rowid, title, text))
+
+def unindex_row(conn, rowid):
+    """Drop a note or chunk from the index; call before the row changes."""
+    conn.execute("DELETE FROM notes_fts WHERE rowid = ?", (rowid,))
+
+def unindex_chunks(conn, note_id):
+    conn.execute("DELETE FROM notes_fts WHERE rowid IN (SELECT id FROM note_chunks WHERE note_id = ?)", (note_id,))
+
+def rebuild_index(conn):
+    conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+    conn.execute("DELETE FROM meta WHERE key = 'index_stale'")
+
+def refresh_stale_index(conn):
+    """Rebuild the index if notes were written from outside NoteStore."""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'index_stale'").fetchone():
+        rebuild_index(conn)
@@ -0,0 +1,260 @@
+"""Notebooks, tags and timestamps, and the note list queries that use them.
+
+A note can be filed in one notebook and carry any number of tags. Tags
+are shared by name, case-insensitively, and a tag is dropped once no note
+carries it; notebooks stay until deleted, which leaves their notes
+unfiled. Every note records when it was created and last modified.
+NoteStore sets both when it saves; triggers fill them in for writers
+that don't, such as a script updating notes directly. Filing, tagging
+and untagging a note are logged in note_changes without bumping its
+version, like attachments.
+
+The note list is read a page at a time with keyset pagination: a page
+starts after the sort key of the last row of the one before, found
+through an index, rather than at an OFFSET that has to be stepped over,
+so every page costs the same however far down the list it is. Each
+filter and sort has an index that returns its rows already in order.
+Lists filtered by tag are the exception, as tags live in their own
+table; see list_notes().
+"""
+import math
+import time
+
+SORT_CREATED = "created"
+SORT_MODIFIED = "modified"
+SORT_TITLE = "title"
+
+# Seconds since the epoch, like time.time(), in plain SQL
+NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+
+ORGANIZE_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS notebooks (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE
+    );
+    CREATE TABLE IF NOT EXISTS tags (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE
+    );
+    CREATE TABLE IF NOT EXISTS note_tags (
+        tag_id INTEGER NOT NULL REFERENCES tags (id),
+        note_id INTEGER NOT NULL,
+        PRIMARY KEY (tag_id, note_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS note_tags_note ON note_tags (note_id);
+    CREATE INDEX IF NOT EXISTS notes_modified ON notes (modified_at);
+    CREATE INDEX IF NOT EXISTS notes_title_nocase ON notes (title COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS notes_notebook ON notes (notebook_id);
+    CREATE INDEX IF NOT EXISTS notes_notebook_modified ON notes (notebook_id, modified_at);
+    CREATE INDEX IF NOT EXISTS notes_notebook_title ON notes (notebook_id, title COLLATE NOCASE);
+    CREATE TRIGGER IF NOT EXISTS notes_timestamps_ai AFTER INSERT ON notes
+    WHEN new.created_at IS NULL OR new.modified_at IS NULL BEGIN
+        UPDATE notes SET created_at = COALESCE(new.created_at, {NOW_SQL}),
+                         modified_at = COALESCE(new.modified_at, new.created_at, {NOW_SQL})
+        WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_modified_au AFTER UPDATE OF version ON notes
+    WHEN new.version IS NOT old.version AND new.modified_at IS old.modified_at BEGIN
+        UPDATE notes SET modified_at = {NOW_SQL} WHERE id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_notebook_au AFTER UPDATE OF notebook_id ON notes
+    WHEN new.notebook_id IS NOT old.notebook_id BEGIN
+        INSERT INTO note_changes (note_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notebooks_ad AFTER DELETE ON notebooks BEGIN
+        UPDATE notes SET notebook_id = NULL WHERE notebook_id = old.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS note_tags_ai AFTER INSERT ON note_tags BEGIN
+        INSERT INTO note_changes (note_id) VALUES (new.note_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS note_tags_ad AFTER DELETE ON note_tags BEGIN
+        INSERT INTO note_changes (note_id) VALUES (old.note_id);
+        DELETE FROM tags WHERE id = old.tag_id
+            AND NOT EXISTS (SELECT 1 FROM note_tags WHERE tag_id = old.tag_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_tags_ad AFTER DELETE ON notes BEGIN
+        DELETE FROM note_tags WHERE note_id = old.id;
+    END;
+"""
+
+def add_columns(conn):
+    """Add the notebook and timestamp columns to notes, dating existing notes from their history."""
+    conn.execute("ALTER TABLE notes ADD COLUMN notebook_id INTEGER REFERENCES notebooks (id)")
+    conn.execute("ALTER TABLE notes ADD COLUMN created_at REAL")
+    conn.execute("ALTER TABLE notes ADD COLUMN modified_at REAL")
+    conn.execute("""
+        UPDATE notes SET
+            created_at = COALESCE((SELECT MIN(created_at) FROM note_revisions WHERE note_id = notes.id), :now),
+            modified_at = COALESCE((SELECT MAX(created_at) FROM note_revisions WHERE note_id = notes.id), :now)
+    """, {"now": time.time()})
+
+# The column each list is sorted by, and in which direction; ties, and
+# the created sort, go by id
+SORTS = {
+    SORT_CREATED: (None, "ASC"),
+    SORT_MODIFIED: ("notes.modified_at", "DESC"),
+    SORT_TITLE: ("notes.title COLLATE NOCASE", "ASC"),
+}
+
+def order_sql(sort, id_column, after):
+    """ORDER BY, and the condition and params for the rows after a page_key(), for a sort."""
+    column, direction = SORTS[sort]
+    op = ">" if direction == "ASC" else "<"
+    if column is None:
+        return f"{id_column} {direction}", f"{id_column} {op} ?", after
+    # Not a row value comparison, as SQLite won't search an index range
+    # with one on a column with a collation
+    return (f"{column} {direction}, {id_column} {direction}",
+            f"{column} {op}= ? AND ({column} {op} ? OR {id_column} {op} ?)",
+            (after[0], after[0], after[1]) if after else None)
+
+NOCASE = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+def page_key(sort, row):
+    """The sort key of an (id, title, modified_at) row, to pass as after= for the next page."""
+    note_id, title, modified_at = row
+    if sort == SORT_MODIFIED:
+        return modified_at, note_id
+    if sort == SORT_TITLE:
+        return title, note_id
+    return (note_id,)
+
+def order_key(sort, row):
+    """A key for an (id, title, modified_at) row that orders rows in Python as list_notes() does."""
+    note_id, title, modified_at = row
+    if sort == SORT_MODIFIED:
+        return -modified_at, -note_id
+    if sort == SORT_TITLE:
+        # SQLite's NOCASE only folds ASCII letters
+        return title.translate(NOCASE), note_id
+    return note_id
+
+TAG_FILTER_SQL = "EXISTS (SELECT 1 FROM note_tags WHERE tag_id = ? AND note_id = notes.id)"
+TAG_ROWS_SQL = "SELECT 1 FROM note_tags WHERE tag_id = ?"
+
+def filter_sql(notebook_id, tag_id):
+    conditions, params = [], []
+    if notebook_id is not None:
+        conditions.append("notes.notebook_id = ?")
+        params.append(notebook_id)
+    if tag_id is not None:
+        conditions.append(TAG_FILTER_SQL)
+        params.append(tag_id)
+    return conditions, params
+
+def count_rows(conn, sql, params, cap):
+    """How many rows a query returns, counting no further than cap + 1."""
+    return conn.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT ?)", (*params, cap + 1)).fetchone()[0]
+
+def read_tag_first(conn, sort, notebook_id, tag_id, limit):
+    """Whether to read a tag's notes through note_tags rather than walk a notes index checking each for the tag.
+
+    Through note_tags, all t tagged notes are sorted, unless the list is
+    in created order, which note_tags keeps them in. Walking a sort index
+    of n notes checks about limit * n / t of them to fill a page, so it
+    wins once t is over sqrt(limit * n). With a notebook filter as well,
+    whichever of the tag and the notebook has fewer notes is read.
+    """
+    if not limit:
+        return True
+    total = conn.execute("SELECT MAX(id) FROM notes").fetchone()[0] or 0
+    cap = math.isqrt(limit * total)
+    if notebook_id is None:
+        return sort == SORT_CREATED or count_rows(conn, TAG_ROWS_SQL, (tag_id,), cap) <= cap
+    in_notebook = count_rows(conn, "SELECT 1 FROM notes WHERE notebook_id = ?", (notebook_id,), cap)
+    cap = min(in_notebook - 1, cap)
+    return count_rows(conn, TAG_ROWS_SQL, (tag_id,), cap) <= cap
+
+def list_notes(conn, sort=SORT_CREATED, notebook_id=None, tag_id=None, after=None, limit=None):
+    """(id, title, modified_at) rows in sort order, starting after the sort key after.
+
+    Without a tag every filter and sort reads an index in order and stops
+    after limit rows. A tag's notes are read through note_tags, already in
+    created order, and sorted for the other orders, which is cheap while
+    they are few. For a common tag SQLite is made to walk the sort index
+    instead, checking each note for the tag; see read_tag_first().
+    """
+    source, id_column = "notes", "notes.id"
+    conditions, params = filter_sql(notebook_id, None)
+    if tag_id is not None:
+        if read_tag_first(conn, sort, notebook_id, tag_id, limit):
+            # CROSS JOIN makes SQLite read the tag's rows first
+            source = "note_tags CROSS JOIN notes ON notes.id = note_tags.note_id"
+            conditions.append("note_tags.tag_id = ?")
+            # Ordering by note_tags' own column lets SQLite see they're in order
+            id_column = "note_tags.note_id"
+        else:
+            conditions.append(TAG_FILTER_SQL)
+        params.append(tag_id)
+    order_by, after_sql, after_params = order_sql(sort, id_column, after)
+    if after is not None:
+        conditions.append(after_sql)
+        params.extend(after_params)
+    where = " AND ".join(conditions) or "1"
+    return conn.execute(f"""
+        SELECT notes.id, notes.title, notes.modified_at FROM {source}
+        WHERE {where} ORDER BY {order_by} LIMIT ?
+    """, (*params, limit or -1)).fetchall()
+
+def matching_note(conn, note_id, notebook_id=None, tag_id=None):
+    """The (id, title, modified_at) row of a note if it passes the filters, else None."""
+    conditions, params = filter_sql(notebook_id, tag_id)
+    where = " AND ".join(["notes.id = ?"] + conditions)
+    return conn.execute(f"SELECT notes.id, notes.title, notes.modified_at FROM notes WHERE {where}",
+                        (note_id, *params)).fetchone()
+
+def list_notebooks(conn):
+    """(id, name) for every notebook, by name."""
+    return conn.execute("SELECT id, name FROM notebooks ORDER BY name").fetchall()
+
+def create_notebook(conn, name):
+    """The id of the notebook called name, creating it if need be."""
+    conn.execute("INSERT INTO notebooks (name) VALUES (?) ON CONFLICT (name) DO NOTHING", (name,))
+    return conn.execute("SELECT id FROM notebooks WHERE name = ?", (name,)).fetchone()[0]
+
+def list_tags(conn):
+    """(id, name) for every tag in use, by name."""
+    return conn.execute("SELECT id, name FROM tags ORDER BY name").fetchall()
+
+def tag_names(names):
+    """Tag names with whitespace collapsed, keyed as SQLite's NOCASE compares them, without empty ones."""
+    wanted = {}
+    for name in names:
+        name = " ".join(name.split())
+        if name:
+            wanted.setdefault(name.translate(NOCASE), name)
+    return wanted
+
+def parse_tags(text):
+    """Tag names from comma-separated text, without empty or repeated ones."""
+    return list(tag_names(text.split(",")).values())
+
+def set_note_tags(conn, note_id, names):
+    """Make a note's tags exactly names, creating tags as needed."""
+    current = {name.translate(NOCASE): tag_id for tag_id, name in conn.execute(
+        "SELECT tags.id, tags.name FROM note_tags JOIN tags ON tags.id = note_tags.tag_id WHERE note_id = ?",
+        (note_id,))}
+    wanted = tag_names(names)
+    for key, tag_id in current.items():
+        if key not in wanted:
+            conn.execute("DELETE FROM note_tags WHERE tag_id = ? AND note_id = ?", (tag_id, note_id))
+    for key, name in wanted.items():
+        if key not in current:
+            conn.execute("INSERT INTO tags (name) VALUES (?) ON CONFLICT (name) DO NOTHING", (name,))
+            tag_id = conn.execute("SELECT id FROM tags WHERE name = ?", (name,)).fetchone()[0]
+            conn.execute("INSERT INTO note_tags (tag_id, note_id) VALUES (?, ?)", (tag_id, note_id))
+
+def note_details(conn, note_id):
+    """(notebook name, [tag names], created_at, modified_at) for a note, None if there is no such note."""
+    row = conn.execute("""
+        SELECT notebooks.name, notes.created_at, notes.modified_at
+        FROM notes LEFT JOIN notebooks ON notebooks.id = notes.notebook_id
+        WHERE notes.id = ?
+    """, (note_id,)).fetchone()
+    if row is None:
+        return None
+    tags = [name for name, in conn.execute("""
+        SELECT tags.name FROM note_tags JOIN tags ON tags.id = note_tags.tag_id
+        WHERE note_tags.note_id = ? ORDER BY tags.name
+    """, (note_id,))]
+    return row[0], tags, row[1], row[2]
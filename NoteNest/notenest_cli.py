@@ -0,0 +1,194 @@
+"""Command-line access to a NoteNest database, without the GUI.
+
+    python notenest_cli.py import DIR [--batch N] [--on-conflict skip|replace]
+    python notenest_cli.py export DEST [--format files|jsonl]
+    python notenest_cli.py reindex
+    python notenest_cli.py vacuum
+    python notenest_cli.py compress
+    python notenest_cli.py gc
+    python notenest_cli.py stats
+
+Import walks DIR for .txt and .md files and stores each as a note titled by
+its path relative to DIR, without the extension. Files are read one at a
+time and written N per transaction, and export streams rows out of the
+database the same way, so memory use does not grow with the number of
+notes. This module must never import PyQt6.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from notestore import COMPRESS_BATCH_SIZE, DB_PATH, IMPORT_BATCH_SIZE, NoteStore
+
+NOTE_EXTENSIONS = (".txt", ".md")
+REPORT_EVERY = 10000
+UNSAFE_FILENAME_CHARS = re.compile(r'[\x00-\x1f<>:"\\|?*]')
+
+def walk_note_files(root):
+    """Yield paths of note files under root, depth first, in name order."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file() and entry.name.lower().endswith(NOTE_EXTENSIONS):
+                yield entry.path
+        stack.extend(reversed(subdirectories))
+
+def read_notes(root, errors):
+    """Yield (title, content) for each note file under root.
+
+    Files that can't be read are reported on stderr and counted in
+    errors[0] instead of aborting the import.
+    """
+    for path in walk_note_files(root):
+        title = os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, "/")
+        try:
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"skipped {path}: {e}", file=sys.stderr)
+            errors[0] += 1
+            continue
+        yield title, content
+
+def report_progress(items, label):
+    """Pass items through, printing a running count to stderr."""
+    count = 0
+    for item in items:
+        yield item
+        count += 1
+        if count % REPORT_EVERY == 0:
+            print(f"{label} {count} notes", file=sys.stderr)
+
+def note_filename(title):
+    """Relative path for a note exported as a file; '/' in a title makes folders."""
+    parts = [UNSAFE_FILENAME_CHARS.sub("_", part).strip(" .") or "_" for part in title.split("/")]
+    return os.path.join(*parts) + ".txt"
+
+def import_command(store, args):
+    if not os.path.isdir(args.source):
+        raise SystemExit(f"not a directory: {args.source}")
+    errors = [0]
+    started = time.perf_counter()
+    notes = report_progress(read_notes(args.source, errors), "read")
+    offered, written = store.import_notes(notes, args.batch, replace=args.on_conflict == "replace")
+    elapsed = time.perf_counter() - started
+    print(f"imported {written} of {offered} notes in {elapsed:.1f}s"
+          f" ({offered - written} unchanged or existing, {errors[0]} unreadable)")
+
+def export_command(store, args):
+    rows = ((title, content) for _, title, content in store.iter_notes())
+    notes = report_progress(rows, "exported")
+    count = 0
+    if args.format == "jsonl":
+        out = sys.stdout if args.dest == "-" else open(args.dest, "w", encoding="utf-8")
+        try:
+            for title, content in notes:
+                out.write(json.dumps({"title": title, "content": content or ""}, ensure_ascii=False) + "\n")
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    else:
+        if args.dest == "-":
+            raise SystemExit("--format files needs a directory, not '-'")
+        for title, content in notes:
+            path = os.path.join(args.dest, note_filename(title or ""))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content or "")
+            count += 1
+    print(f"exported {count} notes", file=sys.stderr)
+
+def reindex_command(store, args):
+    store.rebuild_index()
+    print("search index rebuilt")
+
+def vacuum_command(store, args):
+    before = os.path.getsize(store.path)
+    store.vacuum()
+    after = os.path.getsize(store.path)
+    print(f"vacuumed {store.path}: {before} -> {after} bytes")
+
+def compress_command(store, args):
+    def progress(done, total):
+        if done % REPORT_EVERY < COMPRESS_BATCH_SIZE or done == total:
+            print(f"checked {done} of {total} notes", file=sys.stderr)
+
+    compressed = store.compress_notes(progress=progress)
+    print(f"compressed {compressed} notes")
+
+def gc_command(store, args):
+    removed = store.collect_garbage(sweep=True)
+    print(f"removed {removed} unused attachment files")
+
+def stats_command(store, args):
+    stats = store.content_stats()
+    saved = stats["original_bytes"] - stats["stored_bytes"]
+    percent = 100 * saved / stats["original_bytes"] if stats["original_bytes"] else 0
+    print(f"notes:            {stats['notes']}")
+    print(f"chunked notes:    {stats['chunked']}")
+    print(f"compressed rows:  {stats['compressed']}")
+    print(f"text size:        {stats['original_bytes']} bytes")
+    print(f"stored size:      {stats['stored_bytes']} bytes")
+    print(f"saved:            {saved} bytes ({percent:.1f}%)")
+    print(f"attachments:      {stats['attachments']} ({stats['blobs']} distinct files, {stats['blob_bytes']} bytes)")
+    print(f"notebooks, tags:  {stats['notebooks']}, {stats['tags']}")
+    print(f"database file:    {os.path.getsize(store.path)} bytes")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="notenest", description="Manage a NoteNest database without the GUI.")
+    parser.add_argument("--db", default=DB_PATH, help=f"database file (default: {DB_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="import .txt and .md files from a directory tree")
+    command.add_argument("source", help="directory to import")
+    command.add_argument("--batch", type=int, default=IMPORT_BATCH_SIZE, help="notes per transaction")
+    command.add_argument("--on-conflict", choices=("skip", "replace"), default="skip",
+                         help="what to do when a note with the same title exists")
+    command.set_defaults(run=import_command)
+
+    command = commands.add_parser("export", help="export every note")
+    command.add_argument("dest", help="directory for --format files, file or '-' for --format jsonl")
+    command.add_argument("--format", choices=("files", "jsonl"), default="files")
+    command.set_defaults(run=export_command)
+
+    command = commands.add_parser("reindex", help="rebuild the full-text search index")
+    command.set_defaults(run=reindex_command)
+
+    command = commands.add_parser("vacuum", help="compact the database file")
+    command.set_defaults(run=vacuum_command)
+
+    command = commands.add_parser("compress", help="compress large notes saved before compression existed")
+    command.set_defaults(run=compress_command)
+
+    command = commands.add_parser("gc", help="delete attachment files no note uses any more")
+    command.set_defaults(run=gc_command)
+
+    command = commands.add_parser("stats", help="show note sizes and the space saved by compression")
+    command.set_defaults(run=stats_command)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, "batch", 1) < 1:
+        raise SystemExit("--batch must be at least 1")
+    store = NoteStore(args.db)
+    try:
+        args.run(store, args)
+    except BrokenPipeError:
+        # Output piped into something like head that stopped reading
+        sys.stdout = open(os.devnull, "w")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
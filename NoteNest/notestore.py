@@ -0,0 +1,773 @@
+"""SQLite storage for NoteNest.
+
+NoteStore owns notes.db. It creates and migrates the schema, tunes every
+connection it opens, and hands them out: writes go through one writer
+connection guarded by a lock, reads borrow a connection from a small pool.
+With the database in WAL mode, searches, list loads and background workers
+read concurrently with saves instead of queueing behind them.
+
+Large note bodies are stored compressed (see compression.py) and very
+large ones in chunks (see chunks.py). Methods here take and return plain
+text; the full-text index reads through the note_segments view, which
+decompresses and indexes each chunk as a row of its own. Attached files
+are kept in a folder next to the database (see attachments.py), and
+notebooks, tags and the note list queries are in notebooks.py.
+
+NoteStore writes the index itself next to each change (see fulltext.py),
+so no trigger needs nn_text() and notes.db can be written from any SQLite
+client; such writes are indexed again the next time NoteStore writes.
+
+Nothing here imports Qt, so the same code serves the GUI and scripts.
+"""
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from attachments import (
+    ATTACHMENTS_SCHEMA, BlobStore, add_attachment, blob_folder, blob_stats, collect_garbage, list_attachments
+)
+from changes import CHANGES_SCHEMA, changes_since, last_change, prune_changes
+from chunks import (
+    CHUNKS_SCHEMA, LARGE_NOTE_CHARS, SMALL_NOTE_CHARS, chunk_count, delete_chunks, read_chunk, read_chunks, write_chunks
+)
+from compression import HEADER, content_size, decode_content, encode_content, register_functions
+from drive_sync import OUTBOX_SCHEMA
+from fulltext import (
+    FTS_DROP, FTS_SCHEMA, OLD_TRIGGERS_DROP, STALE_TRIGGERS, index_row, rebuild_index, refresh_stale_index, unindex_row
+)
+from notebooks import (
+    ORGANIZE_SCHEMA, SORT_CREATED, add_columns, create_notebook, filter_sql, list_notebooks, list_notes, list_tags,
+    matching_note, note_details, set_note_tags
+)
+from perf import InstrumentedConnection, timed
+from revisions import REVISIONS_SCHEMA, list_revisions, load_revision, record_revision
+
+DB_PATH = "notes.db"
+
+# Full-text search
+SCHEMA_VERSION = 9
+SEARCH_LIMIT = 200
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+# Backup and restore
+BACKUP_PAGES = 256
+COPY_BLOCK_SIZE = 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Bulk import commits this many notes per transaction
+IMPORT_BATCH_SIZE = 1000
+
+# Compressing notes saved before compression existed, this many at a time
+COMPRESS_BATCH_SIZE = 100
+
+# Connection pool and tuning
+READ_POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 256
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    # Safe in WAL mode: a power loss can only drop the last commits, never corrupt
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+NOTES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT UNIQUE,
+        content TEXT
+    )
+"""
+
+META_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value
+    )
+"""
+
+def build_fts_query(text):
+    """Turn what the user typed into an FTS5 MATCH expression.
+
+    Text in double quotes is matched as a phrase and a word ending in '*' is
+    matched as a prefix. Every term is quoted, so stray FTS5 operators in the
+    input can't produce a syntax error.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        if phrase.strip():
+            terms.append('"' + phrase.replace('"', '""') + '"')
+        elif word:
+            prefix = word.endswith("*")
+            word = word.rstrip("*").replace('"', '""')
+            if word:
+                terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+@timed("store.search_notes")
+def search_notes(conn, text, limit=SEARCH_LIMIT, notebook_id=None, tag_id=None):
+    """Run a user query and return a cursor over ranked (id, title, snippet) rows.
+
+    Only notes in notebook_id and tagged tag_id match, if given. Returns
+    None when the text holds nothing to search for.
+    """
+    query = build_fts_query(text)
+    if not query:
+        return None
+    conditions, params = filter_sql(notebook_id, tag_id)
+    where = " AND ".join(conditions) or "1"
+    # Title matches weigh more than body matches in the bm25 ranking. A
+    # chunked note can match in several chunks; its best match is kept.
+    # Snippets are slow, so they are only made for the rows returned.
+    return conn.execute(f"""
+        WITH hits AS MATERIALIZED (
+            SELECT rowid, bm25(notes_fts, 10.0, 1.0) AS rank FROM notes_fts WHERE notes_fts MATCH ?
+        ), best AS MATERIALIZED (
+            SELECT notes.id, notes.title, hits.rowid AS hit, MIN(hits.rank) AS rank
+            FROM hits
+            LEFT JOIN note_chunks ON note_chunks.id = hits.rowid
+            JOIN notes ON notes.id = COALESCE(note_chunks.note_id, hits.rowid)
+            WHERE {where}
+            GROUP BY notes.id
+            ORDER BY rank
+            LIMIT ?
+        )
+        SELECT best.id, best.title, snippet(notes_fts, 1, ?, ?, '…', 12)
+        FROM best JOIN notes_fts ON notes_fts.rowid = best.hit
+        WHERE notes_fts MATCH ?
+        ORDER BY best.rank
+    """, (query, *params, limit, HIGHLIGHT_START, HIGHLIGHT_END, query))
+
+def load_content(conn, note_id):
+    """A note's text, whether stored plain, compressed or in chunks. None if there is no such note."""
+    row = conn.execute("SELECT content, chunked FROM notes WHERE id = ?", (note_id,)).fetchone()
+    if row is None:
+        return None
+    return read_chunks(conn, note_id) if row[1] else decode_content(row[0])
+
+def check_integrity(db_path):
+    """Raise sqlite3.DatabaseError unless db_path is an intact SQLite database."""
+    conn = sqlite3.connect(db_path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise sqlite3.DatabaseError(f"Integrity check failed: {result}")
+
+def backup_database(source_path, dest_path, progress=None, compress=False):
+    """Copy a live database to dest_path with the SQLite online backup API.
+
+    Pages are copied BACKUP_PAGES at a time so writers are never blocked for
+    long, and progress(done, total) is called after each batch. The copy is
+    integrity-checked, optionally gzipped, and only then moved into place.
+    """
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    fd, temp_path = tempfile.mkstemp(suffix=".db", dir=dest_dir)
+    os.close(fd)
+    try:
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(temp_path)
+        try:
+            report = (lambda status, remaining, total: progress(total - remaining, total)) if progress else None
+            source.backup(target, pages=BACKUP_PAGES, progress=report)
+        finally:
+            target.close()
+            source.close()
+        check_integrity(temp_path)
+        if compress:
+            fd, packed_path = tempfile.mkstemp(suffix=".gz", dir=dest_dir)
+            os.close(fd)
+            try:
+                with open(temp_path, 'rb') as raw, gzip.open(packed_path, 'wb') as packed:
+                    shutil.copyfileobj(raw, packed, COPY_BLOCK_SIZE)
+                os.replace(packed_path, dest_path)
+            except BaseException:
+                os.remove(packed_path)
+                raise
+        else:
+            os.replace(temp_path, dest_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def prepare_restore(backup_path, db_path, progress=None):
+    """Unpack a backup next to db_path and verify it.
+
+    Returns the path of the verified copy, ready for swap_in_database. The
+    backup file itself is left untouched.
+    """
+    with open(backup_path, 'rb') as probe:
+        compressed = probe.read(2) == GZIP_MAGIC
+    total = os.path.getsize(backup_path)
+    fd, temp_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(db_path)))
+    try:
+        with open(backup_path, 'rb') as raw, os.fdopen(fd, 'wb') as restored:
+            source = gzip.GzipFile(fileobj=raw) if compressed else raw
+            for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b""):
+                restored.write(block)
+                if progress:
+                    progress(raw.tell(), total)
+        check_integrity(temp_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+def swap_in_database(restored_path, db_path):
+    """Atomically replace db_path with a prepared copy. All connections must be closed."""
+    # A leftover journal would be replayed against the restored database
+    for suffix in ("-journal", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.replace(restored_path, db_path)
+
+def copy_blobs(source, dest, blobs, progress=None):
+    """Copy (sha256, size) blobs from one BlobStore to another, skipping any it already has.
+
+    Blobs missing from the source are skipped too. Returns the number copied.
+    """
+    total = sum(size for _, size in blobs)
+    done = copied = 0
+    for digest, size in blobs:
+        if source.exists(digest):
+            copied += source.copy_to(digest, dest)
+        done += size
+        if progress:
+            progress(done, total)
+    return copied
+
+class NoteConflictError(Exception):
+    """A save was based on a version of the note that has since been overwritten."""
+
+    def __init__(self, note_id, expected_version, version):
+        super().__init__(f"Note {note_id} is at version {version}, not {expected_version}")
+        self.note_id = note_id
+        self.expected_version = expected_version
+        self.version = version
+
+class NoteStore:
+    """The notes database and its connections.
+
+    Use write() for anything that modifies notes.db and read() for queries.
+    Connections are opened with check_same_thread=False so pooled ones can
+    be borrowed from any thread, but each is only used by one at a time.
+    """
+
+    def __init__(self, path=DB_PATH, readers=READ_POOL_SIZE):
+        self.path = path
+        self.max_readers = readers
+        self.write_lock = threading.RLock()
+        self.pool_lock = threading.Lock()
+        self.blobs = BlobStore(blob_folder(path))
+        # Garbage collection waits while a backup is copying blobs
+        self.backups_running = 0
+        # Bumped by every open(), so connections kept outside the pool know to reconnect
+        self.open_count = 0
+        self.open()
+
+    def open(self):
+        self.open_count += 1
+        self.writer = self.connect()
+        self.readers = queue.LifoQueue()
+        self.reader_count = 0
+        self.migrate()
+        with self.write() as conn:
+            refresh_stale_index(conn)
+            prune_changes(conn)
+
+    def connect(self, readonly=False):
+        """Open a tuned connection to the database."""
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE, factory=InstrumentedConnection)
+        register_functions(conn)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def close(self):
+        with self.write_lock:
+            while True:
+                try:
+                    self.readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self.writer.close()
+
+    @contextmanager
+    def write(self):
+        """Borrow the writer connection for one transaction, committed on success."""
+        with self.write_lock:
+            try:
+                yield self.writer
+            except BaseException:
+                self.writer.rollback()
+                raise
+            else:
+                self.writer.commit()
+
+    @contextmanager
+    def read(self):
+        """Borrow a read-only connection from the pool."""
+        try:
+            conn = self.readers.get_nowait()
+        except queue.Empty:
+            with self.pool_lock:
+                can_open = self.reader_count < self.max_readers
+                if can_open:
+                    self.reader_count += 1
+            conn = self.connect(readonly=True) if can_open else self.readers.get()
+        try:
+            yield conn
+        finally:
+            self.readers.put(conn)
+
+    def migrate(self):
+        """Bring notes.db up to SCHEMA_VERSION."""
+        with self.write() as conn:
+            conn.execute(NOTES_SCHEMA)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 2:
+                conn.executescript(REVISIONS_SCHEMA)
+            if version < 3:
+                conn.execute(META_SCHEMA)
+            if version < 4:
+                conn.execute("ALTER TABLE notes ADD COLUMN chunked INTEGER NOT NULL DEFAULT 0")
+                conn.executescript(CHUNKS_SCHEMA)
+                # (Re)build the full-text index, reading through note_segments
+                conn.executescript(OLD_TRIGGERS_DROP)
+                conn.executescript(FTS_DROP)
+                conn.executescript(FTS_SCHEMA)
+                rebuild_index(conn)
+            if version < 5:
+                conn.execute("ALTER TABLE notes ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+                conn.executescript(CHANGES_SCHEMA)
+            if version < 6:
+                conn.executescript(ATTACHMENTS_SCHEMA)
+            if version < 7:
+                add_columns(conn)
+                conn.executescript(ORGANIZE_SCHEMA)
+            if version < 8:
+                conn.executescript(OUTBOX_SCHEMA)
+            if version < 9:
+                # The index and version triggers called nn_text(), so other
+                # clients couldn't write notes; NoteStore indexes them now
+                conn.executescript(OLD_TRIGGERS_DROP)
+                conn.execute("DROP TRIGGER IF EXISTS notes_version_au")
+                conn.executescript(CHANGES_SCHEMA)
+                conn.executescript(STALE_TRIGGERS)
+            if version < SCHEMA_VERSION:
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @timed("store.list_notes")
+    def list_notes(self, after=None, limit=None, sort=SORT_CREATED, notebook_id=None, tag_id=None):
+        """(id, title, modified_at) rows in sort order, filtered by notebook and tag.
+
+        after is the page_key() of the last row of the previous page.
+        """
+        with self.read() as conn:
+            return list_notes(conn, sort, notebook_id, tag_id, after, limit)
+
+    def matching_note(self, note_id, notebook_id=None, tag_id=None):
+        with self.read() as conn:
+            return matching_note(conn, note_id, notebook_id, tag_id)
+
+    @timed("store.get_content")
+    def get_content(self, note_id):
+        with self.read() as conn:
+            return load_content(conn, note_id)
+
+    def chunk_count(self, note_id):
+        """How many chunks a note is stored in; 0 unless it is a chunked note."""
+        with self.read() as conn:
+            return chunk_count(conn, note_id)
+
+    @timed("store.get_chunk")
+    def get_chunk(self, note_id, seq):
+        with self.read() as conn:
+            return read_chunk(conn, note_id, seq)
+
+    @timed("store.save_note")
+    def save_note(self, title, content, note_id=None, expected_version=None):
+        """Store a note and return (id, version).
+
+        An existing note is updated in place, so its id never changes. Without
+        a note_id, or if that note has been deleted, a new note is inserted.
+        Raises sqlite3.IntegrityError if the title is another note's, rather
+        than overwriting that note. Content changes are
+        recorded in the note's revision history, except for chunked notes,
+        where only the chunks that changed are written.
+
+        With expected_version, raises NoteConflictError instead of saving if
+        note_id has been saved since it was at that version, e.g. by another
+        window. A note deleted in the meantime is saved again as a new note.
+        """
+        chunked = len(content) >= LARGE_NOTE_CHARS
+        with self.write() as conn:
+            refresh_stale_index(conn)
+            row = None
+            if note_id is not None:
+                row = conn.execute(
+                    "SELECT id, content, chunked, version FROM notes WHERE id = ?", (note_id,)
+                ).fetchone()
+                if row and expected_version is not None and row[3] != expected_version:
+                    raise NoteConflictError(note_id, expected_version, row[3])
+            was_chunked = bool(row and row[2])
+            if was_chunked:
+                chunked = len(content) >= SMALL_NOTE_CHARS
+            stored = None if chunked else encode_content(content)
+            now = time.time()
+            if row is None:
+                note_id, version = conn.execute(
+                    "INSERT INTO notes (title, content, chunked, created_at, modified_at) VALUES (?, ?, ?, ?, ?)",
+                    (title, stored, chunked, now, now)
+                ).lastrowid, 1
+            else:
+                note_id, version = row[0], row[3] + 1
+                unindex_row(conn, note_id)
+                # Conditional on the version read above, in case another
+                # process saved in between: the read didn't lock anything
+                updated = conn.execute("""
+                    UPDATE notes SET title = ?, content = ?, chunked = ?, version = ?, modified_at = ?
+                    WHERE id = ? AND version = ?
+                """, (title, stored, chunked, version, now, note_id, row[3])).rowcount
+                if not updated:
+                    raise NoteConflictError(note_id, row[3], self.note_version(note_id))
+            index_row(conn, note_id, title, None if chunked else content)
+            if chunked:
+                write_chunks(conn, note_id, content)
+            else:
+                if was_chunked:
+                    delete_chunks(conn, note_id)
+                previous = decode_content(row[1]) if row and not was_chunked else None
+                record_revision(conn, note_id, content, previous)
+            return note_id, version
+
+    def note_version(self, note_id):
+        """A note's current version, None if there is no such note."""
+        with self.read() as conn:
+            row = conn.execute("SELECT version FROM notes WHERE id = ?", (note_id,)).fetchone()
+        return row[0] if row else None
+
+    def last_change(self):
+        with self.read() as conn:
+            return last_change(conn)
+
+    def changes_since(self, seq):
+        with self.read() as conn:
+            return changes_since(conn, seq)
+
+    def revisions(self, note_id):
+        with self.read() as conn:
+            return list_revisions(conn, note_id)
+
+    def load_revision(self, note_id, rev):
+        with self.read() as conn:
+            return load_revision(conn, note_id, rev)
+
+    @timed("store.delete_note")
+    def delete_note(self, note_id):
+        with self.write() as conn:
+            refresh_stale_index(conn)
+            unindex_row(conn, note_id)
+            delete_chunks(conn, note_id)
+            conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+        self.collect_garbage()
+
+    @timed("store.add_attachment")
+    def add_attachment(self, note_id, source_path, name=None, progress=None):
+        """Attach a copy of a file to a note and return the attachment id.
+
+        The file is copied and hashed before the write lock is taken; content
+        that is already stored is linked rather than stored again.
+        """
+        digest, size, temp_path = self.blobs.stage(source_path, progress)
+        try:
+            with self.write() as conn:
+                return add_attachment(conn, self.blobs, note_id, name or os.path.basename(source_path),
+                                      digest, size, temp_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def list_attachments(self, note_id):
+        with self.read() as conn:
+            return list_attachments(conn, note_id)
+
+    def remove_attachment(self, attachment_id):
+        with self.write() as conn:
+            conn.execute("DELETE FROM attachments WHERE id = ?", (attachment_id,))
+        self.collect_garbage()
+
+    @timed("store.collect_garbage")
+    def collect_garbage(self, sweep=False):
+        """Delete attachment files no note links to. Returns how many were removed."""
+        with self.write() as conn:
+            if self.backups_running:
+                return 0
+            return collect_garbage(conn, self.blobs, sweep)
+
+    def notebooks(self):
+        with self.read() as conn:
+            return list_notebooks(conn)
+
+    def create_notebook(self, name):
+        with self.write() as conn:
+            return create_notebook(conn, name)
+
+    def delete_notebook(self, notebook_id):
+        """Delete a notebook; its notes are kept, in no notebook."""
+        with self.write() as conn:
+            conn.execute("DELETE FROM notebooks WHERE id = ?", (notebook_id,))
+
+    def set_notebook(self, note_id, notebook_id):
+        with self.write() as conn:
+            conn.execute("UPDATE notes SET notebook_id = ? WHERE id = ?", (notebook_id, note_id))
+
+    def tags(self):
+        with self.read() as conn:
+            return list_tags(conn)
+
+    def set_tags(self, note_id, names):
+        with self.write() as conn:
+            if conn.execute("SELECT 1 FROM notes WHERE id = ?", (note_id,)).fetchone():
+                set_note_tags(conn, note_id, names)
+
+    def note_details(self, note_id):
+        with self.read() as conn:
+            return note_details(conn, note_id)
+
+    @timed("store.import_notes")
+    def import_notes(self, notes, batch_size=IMPORT_BATCH_SIZE, replace=False):
+        """Bulk-insert (title, content) pairs from any iterable, one transaction per batch.
+
+        Notes whose title already exists are skipped, or overwritten with
+        replace=True. Bulk imports don't record revision history, and notes
+        large enough to be chunked are saved one at a time. Returns (rows
+        offered, rows written).
+        """
+        offered = written = 0
+        batch = []
+        for title, content in notes:
+            if content is not None and len(content) >= LARGE_NOTE_CHARS:
+                offered += 1
+                written += self._import_large(title, content, replace)
+                continue
+            batch.append((title, content))
+            if len(batch) >= batch_size:
+                written += self._write_batch(batch, replace)
+                offered += len(batch)
+                batch = []
+        if batch:
+            written += self._write_batch(batch, replace)
+            offered += len(batch)
+        return offered, written
+
+    def _write_batch(self, batch, replace):
+        now = time.time()
+        with self.write() as conn:
+            refresh_stale_index(conn)
+            existing = {
+                title: (note_id, content, chunked) for note_id, title, content, chunked in conn.execute(
+                    "SELECT id, title, content, chunked FROM notes WHERE title IN (SELECT value FROM json_each(?))",
+                    (json.dumps([title for title, _ in batch]),)
+                )
+            }
+            written = 0
+            for title, content in batch:
+                stored = encode_content(content)
+                row = existing.get(title)
+                if row is None:
+                    note_id = conn.execute(
+                        "INSERT INTO notes (title, content, created_at, modified_at) VALUES (?, ?, ?, ?)",
+                        (title, stored, now, now)
+                    ).lastrowid
+                elif not replace or (row[1] == stored and not row[2]):
+                    continue
+                else:
+                    note_id = row[0]
+                    unindex_row(conn, note_id)
+                    if row[2]:
+                        delete_chunks(conn, note_id)
+                    conn.execute(
+                        "UPDATE notes SET content = ?, chunked = 0, version = version + 1, modified_at = ? WHERE id = ?",
+                        (stored, now, note_id)
+                    )
+                index_row(conn, note_id, title, content)
+                # A title can come up again later in the batch
+                existing[title] = (note_id, stored, 0)
+                written += 1
+            return written
+
+    def _import_large(self, title, content, replace):
+        with self.read() as conn:
+            row = conn.execute("SELECT id FROM notes WHERE title = ?", (title,)).fetchone()
+        if row and not replace:
+            return 0
+        self.save_note(title, content, row[0] if row else None)
+        return 1
+
+    def iter_notes(self, batch_size=IMPORT_BATCH_SIZE):
+        """Yield (id, title, content) for every note in id order, without loading them all."""
+        with self.read() as conn:
+            cursor = conn.execute("SELECT id, title, content, chunked FROM notes ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for note_id, title, content, chunked in rows:
+                    yield note_id, title, read_chunks(conn, note_id) if chunked else decode_content(content)
+
+    @timed("store.rebuild_index")
+    def rebuild_index(self):
+        with self.write() as conn:
+            rebuild_index(conn)
+            conn.execute("INSERT INTO notes_fts(notes_fts) VALUES ('optimize')")
+
+    @timed("store.vacuum")
+    def vacuum(self):
+        """Compact the database file and fold the WAL back into it."""
+        with self.write_lock:
+            self.writer.commit()
+            self.writer.execute("VACUUM")
+            self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.writer.execute("PRAGMA optimize")
+
+    @timed("store.compress_notes")
+    def compress_notes(self, batch_size=COMPRESS_BATCH_SIZE, progress=None, should_stop=None):
+        """Compress large bodies saved before compression existed.
+
+        Notes are checked in id order and the last id checked is kept in the
+        meta table, so the work can be interrupted and picked up later, and
+        a rerun only looks at notes added since. Compression happens outside
+        the write lock. progress(done, total) is called after each batch.
+        Returns the number of notes compressed.
+        """
+        with self.read() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'compressed_through'").fetchone()
+            after = row[0] if row else 0
+            total = conn.execute("SELECT COUNT(*) FROM notes WHERE id > ?", (after,)).fetchone()[0]
+        done = compressed = 0
+        while not (should_stop and should_stop()):
+            with self.read() as conn:
+                rows = conn.execute(
+                    "SELECT id, content FROM notes WHERE id > ? ORDER BY id LIMIT ?", (after, batch_size)
+                ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for note_id, content in rows:
+                if isinstance(content, str):
+                    stored = encode_content(content)
+                    if isinstance(stored, bytes):
+                        updates.append((stored, note_id, content))
+            after = rows[-1][0]
+            with self.write() as conn:
+                # Skip notes saved again since they were read; saves compress anyway
+                if updates:
+                    compressed += conn.executemany(
+                        "UPDATE notes SET content = ? WHERE id = ? AND content = ?", updates
+                    ).rowcount
+                conn.execute("""
+                    INSERT INTO meta (key, value) VALUES ('compressed_through', ?)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                """, (after,))
+            done += len(rows)
+            if progress:
+                progress(done, total)
+        return compressed
+
+    def content_stats(self):
+        """Note counts and body sizes in bytes, stored and uncompressed."""
+        compressed = stored = original = 0
+        with self.read() as conn:
+            notes, chunked = conn.execute("SELECT COUNT(*), COALESCE(SUM(chunked), 0) FROM notes").fetchone()
+            # Bodies are either in notes.content or, for chunked notes, in note_chunks
+            rows = conn.execute("""
+                SELECT typeof(content), length(CAST(content AS BLOB)),
+                       CASE WHEN typeof(content) = 'blob' THEN substr(content, 1, ?) END
+                FROM notes WHERE NOT chunked
+                UNION ALL
+                SELECT typeof(content), length(CAST(content AS BLOB)),
+                       CASE WHEN typeof(content) = 'blob' THEN substr(content, 1, ?) END
+                FROM note_chunks
+            """, (HEADER.size, HEADER.size))
+            for kind, size, header in rows:
+                stored += size or 0
+                if kind == "blob":
+                    compressed += 1
+                    original += content_size(header)
+                else:
+                    original += size or 0
+            attachments, blobs, blob_bytes = blob_stats(conn)
+            notebooks = conn.execute("SELECT COUNT(*) FROM notebooks").fetchone()[0]
+            tags = conn.execute("SELECT COUNT(*) FROM tags").fetchone()[0]
+        return {"notes": notes, "chunked": chunked, "compressed": compressed,
+                "stored_bytes": stored, "original_bytes": original,
+                "attachments": attachments, "blobs": blobs, "blob_bytes": blob_bytes,
+                "notebooks": notebooks, "tags": tags}
+
+    def search(self, text, limit=SEARCH_LIMIT, notebook_id=None, tag_id=None):
+        """Ranked (id, title, snippet) matches for a user query."""
+        with self.read() as conn:
+            cursor = search_notes(conn, text, limit, notebook_id, tag_id)
+            return cursor.fetchall() if cursor else []
+
+    @timed("store.backup")
+    def backup(self, dest_path, progress=None, compress=False):
+        """Back up notes.db to dest_path and the attachments to the folder next to it.
+
+        Blobs already in that folder, e.g. from an earlier backup to the same
+        place, are not copied again. progress(done, total) counts pages and
+        then bytes of attachments.
+        """
+        with self.write_lock:
+            self.backups_running += 1
+        try:
+            backup_database(self.path, dest_path, progress, compress)
+            with self.read() as conn:
+                blobs = conn.execute("SELECT sha256, size FROM blobs WHERE refcount > 0").fetchall()
+            copy_blobs(self.blobs, BlobStore(blob_folder(dest_path)), blobs, progress)
+        finally:
+            with self.write_lock:
+                self.backups_running -= 1
+
+    def prepare_restore(self, backup_path, progress=None):
+        """Unpack and verify a backup, and bring in the attachments it links to that are missing here."""
+        restored_path = prepare_restore(backup_path, self.path, progress)
+        try:
+            conn = sqlite3.connect(f"file:{restored_path}?mode=ro", uri=True)
+            try:
+                has_blobs = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'blobs'").fetchone()
+                blobs = conn.execute("SELECT sha256, size FROM blobs WHERE refcount > 0").fetchall() if has_blobs else []
+            finally:
+                conn.close()
+            copy_blobs(BlobStore(blob_folder(backup_path)), self.blobs, blobs, progress)
+        except BaseException:
+            os.remove(restored_path)
+            raise
+        return restored_path
+
+    @timed("store.restore")
+    def restore(self, restored_path):
+        """Swap in a copy made by prepare_restore and reopen the database."""
+        self.close()
+        try:
+            swap_in_database(restored_path, self.path)
+        finally:
+            self.open()
+        # Attachments only the replaced notes linked to
+        self.collect_garbage(sweep=True)
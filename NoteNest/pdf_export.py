@@ -0,0 +1,151 @@
+"""Batch PDF export in a pool of worker processes.
+
+Laying out and printing a QTextDocument is CPU-bound and holds the GIL, so
+a batch is rendered in separate processes, each with its own offscreen
+QGuiApplication and read-only connection to notes.db. Only note ids and
+file names cross the process boundary. Workers are started with 'spawn',
+never 'fork', since a forked copy of a running Qt application is unusable.
+
+export_pdfs() blocks until the batch is done, so the GUI calls it from a
+background thread and passes callbacks for progress and cancellation.
+"""
+import multiprocessing
+import os
+import re
+import sqlite3
+
+from notestore import load_content
+
+MAX_PROCESSES = 4
+POLL_SECONDS = 0.2
+TITLE_POINT_SIZE_RATIO = 1.5
+UNSAFE_FILENAME_CHARS = re.compile(r'[\x00-\x1f<>:"/\\|?*]')
+
+# Per-process state, set up by init_worker
+_app = None
+_db_path = None
+_conn = None
+_font = None
+
+def init_worker(db_path, font):
+    global _app, _db_path, _font
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtGui import QFont, QGuiApplication
+
+    _app = QGuiApplication.instance() or QGuiApplication([])
+    # Connected on first use: a Pool replaces a worker whose initializer
+    # raises, forever, so nothing that can fail belongs here
+    _db_path = db_path
+    _font = QFont()
+    if font:
+        _font.fromString(font)
+
+def render_notes(note_ids, path):
+    """Render notes into one PDF at path, each starting on a new page."""
+    from PyQt6.QtGui import QFont, QPageSize, QPdfWriter, QTextBlockFormat, QTextCharFormat, QTextCursor, QTextDocument
+
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(f"file:{_db_path}?mode=ro", uri=True)
+    document = QTextDocument()
+    document.setDefaultFont(_font)
+    title_format = QTextCharFormat()
+    title_format.setFontWeight(QFont.Weight.Bold)
+    if _font.pointSizeF() > 0:
+        title_format.setFontPointSize(_font.pointSizeF() * TITLE_POINT_SIZE_RATIO)
+    body_format = QTextCharFormat()
+    cursor = QTextCursor(document)
+    first = True
+    for note_id in note_ids:
+        row = _conn.execute("SELECT title FROM notes WHERE id = ?", (note_id,)).fetchone()
+        if row is None:
+            continue
+        title, content = row[0], load_content(_conn, note_id)
+        if not first:
+            page_break = QTextBlockFormat()
+            page_break.setPageBreakPolicy(QTextBlockFormat.PageBreakFlag.PageBreak_AlwaysBefore)
+            cursor.insertBlock(page_break)
+        first = False
+        cursor.insertText(title or "", title_format)
+        cursor.insertBlock(QTextBlockFormat())
+        cursor.insertText(content or "", body_format)
+
+    temp_path = path + ".part"
+    writer = QPdfWriter(temp_path)
+    writer.setPageSize(QPageSize(QPageSize.PageSizeId.A4))
+    writer.setTitle(os.path.splitext(os.path.basename(path))[0])
+    document.print(writer)
+    del writer  # Finishes the file
+    os.replace(temp_path, path)
+
+def render_job(job):
+    """Pool entry point: render one job, returning (index, error or None)."""
+    index, note_ids, path = job
+    try:
+        render_notes(note_ids, path)
+    except Exception as e:
+        return index, str(e)
+    return index, None
+
+def pdf_filename(title, note_id, taken):
+    """A unique file name for a note's PDF within one export folder."""
+    name = UNSAFE_FILENAME_CHARS.sub("_", title or "").strip(" .") or "Untitled"
+    if name.lower() in taken:
+        name = f"{name} ({note_id})"
+    taken.add(name.lower())
+    return name + ".pdf"
+
+def plan_jobs(notes, dest, merged):
+    """Split (id, title) pairs into render jobs of (index, note_ids, path).
+
+    A merged export is one job writing dest; otherwise each note becomes a
+    file inside the dest folder.
+    """
+    if merged:
+        return [(0, [note_id for note_id, _ in notes], dest)]
+    taken = set()
+    return [(index, [note_id], os.path.join(dest, pdf_filename(title, note_id, taken)))
+            for index, (note_id, title) in enumerate(notes)]
+
+def export_pdfs(db_path, notes, dest, merged=False, font=None, progress=None, should_stop=None):
+    """Render (id, title) notes to PDF, one file each in dest or merged into dest.
+
+    progress(done, total) is called as jobs finish. When should_stop()
+    returns true the workers are killed and the export ends early. Returns
+    (files written, [(path, error)] for jobs that failed).
+    """
+    jobs = plan_jobs(notes, dest, merged)
+    if not jobs:
+        return 0, []
+    if not merged:
+        os.makedirs(dest, exist_ok=True)
+    processes = max(1, min(os.cpu_count() or 1, MAX_PROCESSES, len(jobs)))
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(processes, initializer=init_worker, initargs=(db_path, font))
+    written, failures, finished = 0, [], set()
+    try:
+        results = pool.imap_unordered(render_job, jobs)
+        for done in range(1, len(jobs) + 1):
+            while True:
+                if should_stop and should_stop():
+                    return written, failures
+                try:
+                    index, error = results.next(timeout=POLL_SECONDS)
+                    break
+                except multiprocessing.TimeoutError:
+                    pass
+            finished.add(index)
+            if error is None:
+                written += 1
+            else:
+                failures.append((jobs[index][2], error))
+            if progress:
+                progress(done, len(jobs))
+    finally:
+        # terminate() also stops jobs still rendering when cancelled
+        pool.terminate()
+        pool.join()
+        for index, _, path in jobs:
+            if index not in finished and os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+    return written, failures
@@ -0,0 +1,267 @@
+"""Lightweight timing of hot paths, for diagnosing "NoteNest is slow" reports.
+
+Functions are timed with the @timed decorator and SQL through the
+connections NoteStore opens, whose class is InstrumentedConnection. Each
+timing goes into a per-name Stat with a latency histogram and row count.
+Statements slower than SLOW_SQL_MS are also kept in a ring buffer of the
+last SLOW_SQL_KEEP, with their text but never their parameters, which hold
+note contents.
+
+Nothing is recorded until enable() is called, or NOTENEST_PERF is set.
+While disabled, a timed function or SQL statement costs one extra Python
+call and a flag check.
+
+Nothing here imports Qt.
+"""
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Histogram bucket upper bounds; the last bucket counts everything slower
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+SLOW_SQL_MS = 20
+SLOW_SQL_KEEP = 100
+SQL_TEXT_LIMIT = 500
+
+enabled = False
+lock = threading.Lock()
+stats = {}
+slow_sql = deque(maxlen=SLOW_SQL_KEEP)
+recording_since = None
+
+class Stat:
+    """Call count, timings and rows recorded under one name."""
+
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms, rows):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.rows += rows
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls."""
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        histogram = {f"<={bound}ms": count for bound, count in zip(BUCKETS_MS, self.buckets)}
+        histogram[f">{BUCKETS_MS[-1]}ms"] = self.buckets[-1]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0,
+            "p50_ms": round(self.percentile(0.5), 3),
+            "p95_ms": round(self.percentile(0.95), 3),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "histogram": histogram,
+        }
+
+def enable(on=True):
+    global enabled, recording_since
+    if on and not enabled:
+        recording_since = time.time()
+    enabled = on
+
+def reset():
+    global recording_since
+    with lock:
+        stats.clear()
+        slow_sql.clear()
+        recording_since = time.time() if enabled else None
+
+def record(name, ms, rows=0):
+    with lock:
+        stat = stats.get(name)
+        if stat is None:
+            stat = stats[name] = Stat()
+        stat.add(ms, rows)
+
+def sql_text(sql):
+    """Statement text with whitespace collapsed, so each statement has one name."""
+    text = re.sub(r"\s+", " ", sql).strip()
+    return text if len(text) <= SQL_TEXT_LIMIT else text[:SQL_TEXT_LIMIT] + "…"
+
+def record_sql(sql, ms, rows):
+    text = sql_text(sql)
+    record("sql: " + text, ms, rows)
+    if ms >= SLOW_SQL_MS:
+        with lock:
+            slow_sql.append({
+                "sql": text,
+                "ms": round(ms, 3),
+                "rows": rows,
+                "thread": threading.current_thread().name,
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            })
+
+def timed(name):
+    """Decorator recording how long each call takes under name.
+
+    Slots connected to signals that carry arguments the method doesn't
+    take need @pyqtSlot() on top, as PyQt can no longer tell from the
+    wrapper which arguments to pass.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorate
+
+def snapshot():
+    """Everything recorded so far, as a JSON-serialisable dict."""
+    with lock:
+        return {
+            "enabled": enabled,
+            "recording_since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(recording_since))
+            if recording_since else None,
+            "taken_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "stats": {name: stat.as_dict() for name, stat in sorted(stats.items())},
+            "slow_sql": list(slow_sql),
+        }
+
+def export_json(path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, indent=2)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """A cursor that times its statement, including the rows fetched from it.
+
+    A statement is recorded once its rows run out, or when the cursor runs
+    another one or is closed or collected.
+    """
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self.finish()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._ms = (time.perf_counter() - start) * 1000
+        self._rows = 0
+        self._sql = sql
+        if self.description is None:
+            self.finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._ms = (time.perf_counter() - start) * 1000
+        self._rows = 0
+        self._sql = sql
+        self.finish()
+        return self
+
+    def fetched(self, start, rows, done):
+        if self._sql is None:
+            return
+        self._ms += (time.perf_counter() - start) * 1000
+        self._rows += rows
+        if done:
+            self.finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.fetched(start, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.fetched(start, 0, True)
+            raise
+        self.fetched(start, 1, False)
+        return row
+
+    def finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            record_sql(sql, self._ms, self._rows or max(self.rowcount, 0))
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self.finish()
+        except Exception:
+            pass
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection factory whose statements and commits are timed while recording is enabled."""
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = InstrumentedCursor if enabled else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if not enabled:
+            return super().execute(sql, parameters)
+        return self.cursor(InstrumentedCursor).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not enabled:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor(InstrumentedCursor).executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if not enabled:
+            return super().commit()
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            record_sql("COMMIT", (time.perf_counter() - start) * 1000, 0)
+
+enable(os.environ.get("NOTENEST_PERF", "") not in ("", "0"))
@@ -0,0 +1,159 @@
+"""Revision history for notes, stored as compressed deltas.
+
+Every save that changes a note's content adds a row to note_revisions. Most
+rows hold a zlib-compressed line diff against the previous revision; every
+SNAPSHOT_INTERVAL revisions (or whenever the diff is large) a full
+compressed snapshot is stored instead. Any revision is rebuilt by replaying
+the diffs after the nearest snapshot at or before it, so a lookup never
+replays more than SNAPSHOT_INTERVAL diffs.
+
+History is capped per note by revision count and by stored bytes. The oldest
+snapshot chains are dropped first, so the chain holding the newest revision
+is always kept.
+"""
+import difflib
+import hashlib
+import json
+import time
+import zlib
+
+SNAPSHOT_INTERVAL = 20
+MAX_REVISIONS = 200
+MAX_HISTORY_BYTES = 8 * 1024 * 1024
+COMPRESSION_LEVEL = 6
+
+REVISIONS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS note_revisions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        note_id INTEGER NOT NULL,
+        rev INTEGER NOT NULL,
+        is_snapshot INTEGER NOT NULL,
+        digest BLOB NOT NULL,
+        data BLOB NOT NULL,
+        created_at REAL NOT NULL,
+        UNIQUE (note_id, rev)
+    );
+    CREATE TRIGGER IF NOT EXISTS notes_revisions_ad AFTER DELETE ON notes BEGIN
+        DELETE FROM note_revisions WHERE note_id = old.id;
+    END;
+"""
+
+def revision_digest(content):
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+def make_delta(old, new):
+    """Line diff turning old into new.
+
+    The result is a list of ops: [start, end] copies old lines start:end and
+    a string inserts new text. The common prefix and suffix are trimmed
+    before running difflib, which keeps diffs of local edits to big notes
+    cheap.
+    """
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    prefix = 0
+    while prefix < len(a) and prefix < len(b) and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < len(a) - prefix and suffix < len(b) - prefix
+           and a[len(a) - 1 - suffix] == b[len(b) - 1 - suffix]):
+        suffix += 1
+
+    ops = [[0, prefix]] if prefix else []
+    matcher = difflib.SequenceMatcher(None, a[prefix:len(a) - suffix], b[prefix:len(b) - suffix])
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([prefix + i1, prefix + i2])
+        elif j2 > j1:
+            ops.append("".join(b[prefix + j1:prefix + j2]))
+    if suffix:
+        ops.append([len(a) - suffix, len(a)])
+    return ops
+
+def apply_delta(old, ops):
+    lines = old.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(lines[op[0]:op[1]])
+    return "".join(parts)
+
+def record_revision(conn, note_id, content, previous=None):
+    """Add a revision of note_id holding content, unless it matches the latest one.
+
+    previous is the note's content before this save. It is used as the diff
+    base when it matches the latest revision; otherwise a snapshot is stored.
+    """
+    digest = revision_digest(content)
+    latest = conn.execute("""
+        SELECT rev, digest FROM note_revisions WHERE note_id = ? ORDER BY rev DESC LIMIT 1
+    """, (note_id,)).fetchone()
+    if latest and latest[1] == digest:
+        return None
+    rev = latest[0] + 1 if latest else 1
+
+    is_snapshot, data = True, None
+    if latest and previous is not None and revision_digest(previous) == latest[1]:
+        last_snapshot = conn.execute("""
+            SELECT MAX(rev) FROM note_revisions WHERE note_id = ? AND is_snapshot
+        """, (note_id,)).fetchone()[0]
+        if rev - last_snapshot < SNAPSHOT_INTERVAL:
+            delta = zlib.compress(json.dumps(make_delta(previous, content)).encode('utf-8'), COMPRESSION_LEVEL)
+            # A diff rewriting most of the note is not worth replaying later
+            if len(delta) < len(content) // 4:
+                is_snapshot, data = False, delta
+    if is_snapshot:
+        data = zlib.compress(content.encode('utf-8'), COMPRESSION_LEVEL)
+
+    conn.execute("""
+        INSERT INTO note_revisions (note_id, rev, is_snapshot, digest, data, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (note_id, rev, is_snapshot, digest, data, time.time()))
+    compact_history(conn, note_id)
+    return rev
+
+def compact_history(conn, note_id, max_revisions=MAX_REVISIONS, max_bytes=MAX_HISTORY_BYTES):
+    """Drop the oldest snapshot chains of a note while its history is over budget."""
+    while True:
+        count, size = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM note_revisions WHERE note_id = ?
+        """, (note_id,)).fetchone()
+        if count <= max_revisions and size <= max_bytes:
+            return
+        # The second snapshot becomes the oldest revision kept
+        cutoff = conn.execute("""
+            SELECT rev FROM note_revisions WHERE note_id = ? AND is_snapshot ORDER BY rev LIMIT 1 OFFSET 1
+        """, (note_id,)).fetchone()
+        if cutoff is None:
+            return
+        conn.execute("DELETE FROM note_revisions WHERE note_id = ? AND rev < ?", (note_id, cutoff[0]))
+
+def list_revisions(conn, note_id):
+    """(rev, created_at) for every stored revision of a note, newest first."""
+    return conn.execute("""
+        SELECT rev, created_at FROM note_revisions WHERE note_id = ? ORDER BY rev DESC
+    """, (note_id,)).fetchall()
+
+def load_revision(conn, note_id, rev):
+    """Rebuild the content of one revision, or None if it is not stored."""
+    start = conn.execute("""
+        SELECT MAX(rev) FROM note_revisions WHERE note_id = ? AND rev <= ? AND is_snapshot
+    """, (note_id, rev)).fetchone()[0]
+    if start is None:
+        return None
+    rows = conn.execute("""
+        SELECT rev, is_snapshot, data FROM note_revisions
+        WHERE note_id = ? AND rev BETWEEN ? AND ? ORDER BY rev
+    """, (note_id, start, rev)).fetchall()
+    if not rows or rows[-1][0] != rev:
+        return None
+    content = None
+    for _, is_snapshot, data in rows:
+        data = zlib.decompress(data)
+        if is_snapshot:
+            content = data.decode('utf-8')
+        else:
+            content = apply_delta(content, json.loads(data))
+    return content
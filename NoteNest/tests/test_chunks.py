@@ -0,0 +1,108 @@
+"""Chunked notes: splitting, rewriting changed chunks and streaming them back."""
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunks import CHUNK_MAX_CHARS, CHUNK_MIN_CHARS, read_chunks, split_chunks, write_chunks
+from drive_sync import ChunkedContent, open_content
+from notestore import NoteStore
+
+def large_text(lines=100000, seed=1):
+    rng = random.Random(seed)
+    return "".join(f"line {i} {rng.randrange(10 ** 6)} café\n" for i in range(lines))
+
+class SplitChunksTest(unittest.TestCase):
+
+    def test_chunks_join_back_to_the_text(self):
+        text = large_text()
+        chunks = split_chunks(text)
+
+        self.assertEqual("".join(chunks), text)
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks[:-1]:
+            self.assertTrue(CHUNK_MIN_CHARS <= len(chunk) <= CHUNK_MAX_CHARS)
+            self.assertTrue(chunk.endswith("\n"))
+
+    def test_long_lines_are_cut(self):
+        text = "x" * (CHUNK_MAX_CHARS * 2 + 10)
+        self.assertEqual([len(chunk) for chunk in split_chunks(text)], [CHUNK_MAX_CHARS, CHUNK_MAX_CHARS, 10])
+
+    def test_an_edit_only_moves_nearby_boundaries(self):
+        text = large_text()
+        middle = len(text) // 2
+        edited = text[:middle] + "an inserted line\n" + text[middle:]
+        before, after = split_chunks(text), split_chunks(edited)
+
+        self.assertEqual(before[0], after[0])
+        self.assertEqual(before[-1], after[-1])
+        self.assertLessEqual(len(set(after) - set(before)), 2)
+
+class WriteChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = NoteStore(os.path.join(self.folder.name, "notes.db"))
+        self.text = large_text()
+        self.note_id, _ = self.store.save_note("big", self.text)
+
+    def tearDown(self):
+        self.store.close()
+        self.folder.cleanup()
+
+    def chunk_ids(self):
+        with self.store.read() as conn:
+            return [chunk_id for chunk_id, in conn.execute(
+                "SELECT id FROM note_chunks WHERE note_id = ? ORDER BY seq", (self.note_id,)
+            )]
+
+    def test_chunks_read_back_as_the_text(self):
+        self.assertEqual(self.store.get_content(self.note_id), self.text)
+        self.assertEqual(self.store.chunk_count(self.note_id), len(split_chunks(self.text)))
+
+    def test_a_local_edit_rewrites_only_the_chunks_it_touches(self):
+        before = self.chunk_ids()
+        middle = len(self.text) // 2
+        edited = self.text[:middle] + "an inserted line\n" + self.text[middle:]
+
+        with self.store.write() as conn:
+            written = write_chunks(conn, self.note_id, edited)
+            self.assertEqual(read_chunks(conn, self.note_id), edited)
+        after = self.chunk_ids()
+
+        self.assertLessEqual(written, 2)
+        self.assertEqual(len(set(after) - set(before)), written)
+        self.assertEqual((after[0], after[-1]), (before[0], before[-1]))
+
+    def test_rewriting_the_same_text_writes_nothing(self):
+        before = self.chunk_ids()
+        with self.store.write() as conn:
+            self.assertEqual(write_chunks(conn, self.note_id, self.text), 0)
+        self.assertEqual(self.chunk_ids(), before)
+
+    def test_stream_reads_and_seeks_across_chunks(self):
+        data = self.text.encode('utf-8')
+        rng = random.Random(2)
+        with self.store.read() as conn:
+            stream = open_content(conn, "notes", self.note_id)
+            self.assertIsInstance(stream, ChunkedContent)
+            self.assertEqual(stream.seek(0, io.SEEK_END), len(data))
+            stream.seek(0)
+            self.assertEqual(stream.read(), data)
+            for _ in range(50):
+                offset, size = rng.randrange(len(data)), rng.randrange(1, 3 * CHUNK_MIN_CHARS)
+                stream.seek(offset)
+                self.assertEqual(stream.read(size), data[offset:offset + size])
+                self.assertEqual(stream.tell(), min(offset + size, len(data)))
+            stream.seek(-10, io.SEEK_END)
+            stream.seek(4, io.SEEK_CUR)
+            self.assertEqual(stream.read(100), data[-6:])
+            self.assertEqual(stream.read(), b"")
+            stream.close()
+
+if __name__ == "__main__":
+    unittest.main()
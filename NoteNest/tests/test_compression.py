@@ -0,0 +1,84 @@
+"""Compressed note bodies: encoding, decoding and streaming the text back."""
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import (
+    COMPRESS_THRESHOLD, HEADER, READ_BLOCK_SIZE, DecodedStream, content_size, decode_content, encode_content
+)
+from drive_sync import open_content
+from notestore import NoteStore
+
+def compressible_text(lines=20000):
+    return "".join(f"line {i}: naïve café ünïcode\n" for i in range(lines))
+
+class EncodeContentTest(unittest.TestCase):
+
+    def test_small_bodies_stay_text(self):
+        text = "x" * (COMPRESS_THRESHOLD - 1)
+        self.assertIs(encode_content(text), text)
+        self.assertIsNone(encode_content(None))
+
+    def test_large_bodies_round_trip(self):
+        text = compressible_text()
+        stored = encode_content(text)
+
+        self.assertIsInstance(stored, bytes)
+        self.assertLess(len(stored), len(text))
+        self.assertEqual(decode_content(stored), text)
+        self.assertEqual(content_size(stored), len(text.encode('utf-8')))
+        self.assertEqual(decode_content(text), text)
+
+    def test_garbage_is_refused(self):
+        with self.assertRaises(ValueError):
+            decode_content(b"not compressed")
+
+class DecodedStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.text = compressible_text()
+        self.data = self.text.encode('utf-8')
+        self.stored = encode_content(self.text)
+
+    def check_reads(self, stream):
+        rng = random.Random(2)
+        self.assertEqual(stream.seek(0, io.SEEK_END), len(self.data))
+        stream.seek(0)
+        self.assertEqual(stream.read(), self.data)
+        for _ in range(50):
+            # Both forwards and backwards, which decompresses from the start again
+            offset, size = rng.randrange(len(self.data)), rng.randrange(1, 3 * READ_BLOCK_SIZE)
+            stream.seek(offset)
+            self.assertEqual(stream.read(size), self.data[offset:offset + size])
+            self.assertEqual(stream.tell(), min(offset + size, len(self.data)))
+        stream.seek(-5, io.SEEK_END)
+        self.assertEqual(stream.read(), self.data[-5:])
+        self.assertEqual(stream.read(), b"")
+
+    def test_reads_and_seeks_over_a_stored_body(self):
+        self.check_reads(DecodedStream(io.BytesIO(self.stored)))
+
+    def test_reads_and_seeks_over_a_blob_in_the_database(self):
+        with tempfile.TemporaryDirectory() as folder:
+            store = NoteStore(os.path.join(folder, "notes.db"))
+            try:
+                note_id, _ = store.save_note("note", self.text)
+                with store.read() as conn:
+                    stream = open_content(conn, "notes", note_id)
+                    self.assertIsInstance(stream, DecodedStream)
+                    self.check_reads(stream)
+                    stream.close()
+            finally:
+                store.close()
+
+    def test_header_is_required(self):
+        with self.assertRaises(ValueError):
+            DecodedStream(io.BytesIO(b"x" * HEADER.size))
+
+if __name__ == "__main__":
+    unittest.main()
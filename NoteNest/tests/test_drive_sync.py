@@ -0,0 +1,185 @@
+"""Drive sync against a temporary NoteStore and LocalDriveService.
+
+Run from the NoteNest folder with python -m pytest tests or
+python -m unittest discover tests.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from drive_sync import DriveSyncer, LocalDriveService, enqueue_upload
+from notestore import NoteStore
+
+class FlakyDriveService(LocalDriveService):
+    """A LocalDriveService whose uploads fail while offline is set."""
+
+    def __init__(self, folder):
+        super().__init__(folder)
+        self.offline = False
+        self.on_upload = None
+
+    def create(self, body=None, media_body=None, fields=None):
+        self.check()
+        return super().create(body, media_body, fields)
+
+    def update(self, fileId, body=None, media_body=None, fields=None):
+        self.check()
+        return super().update(fileId, body, media_body, fields)
+
+    def check(self):
+        if self.on_upload:
+            self.on_upload()
+        if self.offline:
+            raise OSError("offline")
+
+class DriveSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.folder.name, "notes.db")
+        self.store = NoteStore(self.db_path)
+        self.service = FlakyDriveService(os.path.join(self.folder.name, "drive"))
+        self.syncer = DriveSyncer(self.store.connect, lambda: self.service, blobs=self.store.blobs)
+
+    def tearDown(self):
+        self.store.close()
+        self.folder.cleanup()
+
+    def outbox(self):
+        with self.store.read() as conn:
+            return conn.execute(
+                "SELECT note_id, attempts, next_attempt, last_error FROM sync_outbox ORDER BY id"
+            ).fetchall()
+
+    def drive_file(self, note_id):
+        with self.store.read() as conn:
+            file_id, = conn.execute("SELECT file_id FROM drive_files WHERE note_id = ?", (note_id,)).fetchone()
+        with open(os.path.join(self.service.folder, file_id), 'rb') as f:
+            content = f.read().decode('utf-8')
+        with open(os.path.join(self.service.folder, f"{file_id}.json"), encoding='utf-8') as f:
+            name = json.load(f)["name"]
+        return file_id, name, content
+
+    def test_queued_notes_are_uploaded_and_removed_from_the_outbox(self):
+        first, _ = self.store.save_note("first", "first\none")
+        second, _ = self.store.save_note("second", "second\ntwo")
+
+        self.assertEqual(self.syncer.queue_changed(), 2)
+        self.assertEqual(self.syncer.seconds_until_due(), 0.0)
+        synced = []
+        self.assertEqual(self.syncer.run_due(on_synced=lambda title, file_id: synced.append(title)), 2)
+
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(synced, ["first", "second"])
+        self.assertEqual(self.drive_file(first)[1:], ("first", "first\none"))
+        self.assertEqual(self.drive_file(second)[1:], ("second", "second\ntwo"))
+        self.assertIsNone(self.syncer.seconds_until_due())
+
+    def test_unchanged_notes_are_not_queued_again(self):
+        note_id, _ = self.store.save_note("note", "note\nbody")
+        self.syncer.queue_changed()
+        self.syncer.run_due()
+
+        self.assertEqual(self.syncer.queue_changed(), 0)
+        self.store.save_note("note", "note\nedited", note_id)
+        self.assertEqual(self.syncer.queue_changed(), 1)
+        self.assertEqual(self.syncer.queue_changed(), 0)
+        self.syncer.run_due()
+        self.assertEqual(self.drive_file(note_id)[2], "note\nedited")
+        self.assertEqual(self.service.uploads, 2)
+
+    def test_renamed_note_updates_its_drive_file(self):
+        note_id, _ = self.store.save_note("old name", "old name\nbody")
+        self.syncer.queue_changed()
+        self.syncer.run_due()
+        file_id = self.drive_file(note_id)[0]
+
+        self.store.save_note("new name", "new name\nbody", note_id)
+        self.syncer.queue_changed()
+        self.syncer.run_due()
+
+        self.assertEqual(self.drive_file(note_id), (file_id, "new name", "new name\nbody"))
+        self.assertEqual(len([name for name in os.listdir(self.service.folder) if name.endswith(".json")]), 1)
+
+    def test_snapshot_uploads_the_queued_text(self):
+        note_id, _ = self.store.save_note("note", "note\nsaved")
+        with self.store.write() as conn:
+            enqueue_upload(conn, note_id, "note", "note\nunsaved edit")
+
+        self.assertEqual(self.syncer.run_due(), 1)
+        self.assertEqual(self.drive_file(note_id)[2], "note\nunsaved edit")
+
+    def test_failed_upload_backs_off_and_is_retried(self):
+        note_id, _ = self.store.save_note("note", "note\nbody")
+        self.syncer.queue_changed()
+        self.service.offline = True
+        failures = []
+
+        before = time.time()
+        self.assertEqual(self.syncer.run_due(on_failed=lambda title, error: failures.append((title, error))), 0)
+
+        [(queued_id, attempts, next_attempt, last_error)] = self.outbox()
+        self.assertEqual((queued_id, attempts, last_error), (note_id, 1, "offline"))
+        self.assertGreater(next_attempt, before)
+        self.assertEqual(failures, [("note", "offline")])
+        self.assertGreater(self.syncer.seconds_until_due(), 0)
+        # Not due yet, so nothing is attempted
+        self.assertEqual(self.syncer.run_due(), 0)
+        self.assertEqual(self.outbox()[0][1], 1)
+
+        self.service.offline = False
+        with self.store.write() as conn:
+            conn.execute("UPDATE sync_outbox SET next_attempt = 0")
+        self.assertEqual(self.syncer.run_due(), 1)
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(self.drive_file(note_id)[2], "note\nbody")
+
+    def test_entry_is_given_up_after_max_attempts(self):
+        self.store.save_note("note", "note\nbody")
+        self.syncer.max_attempts = 2
+        self.syncer.queue_changed()
+        self.service.offline = True
+        for _ in range(2):
+            with self.store.write() as conn:
+                conn.execute("UPDATE sync_outbox SET next_attempt = 0")
+            self.syncer.run_due()
+
+        self.assertEqual(self.outbox()[0][1], 2)
+        self.assertIsNone(self.syncer.seconds_until_due())
+
+    def test_outbox_survives_reopening(self):
+        note_id, _ = self.store.save_note("note", "note\nbody")
+        self.syncer.queue_changed()
+        self.store.close()
+
+        self.store = NoteStore(self.db_path)
+        syncer = DriveSyncer(self.store.connect, lambda: self.service)
+        self.assertEqual(syncer.run_due(), 1)
+        self.assertEqual(self.drive_file(note_id)[2], "note\nbody")
+
+    def test_notes_can_be_saved_while_uploading(self):
+        for title in ("first", "second", "third"):
+            self.store.save_note(title, f"{title}\nbody")
+        self.syncer.queue_changed()
+        # Another window, with its own connections to notes.db
+        other = NoteStore(self.db_path)
+        saved = []
+
+        def save_elsewhere():
+            saved.append(other.save_note(f"edit {len(saved)}", f"edit {len(saved)}\nsaved mid-sync")[0])
+
+        self.service.on_upload = save_elsewhere
+        try:
+            self.assertEqual(self.syncer.run_due(), 3)
+        finally:
+            other.close()
+        self.assertEqual(len(saved), 3)
+        self.assertEqual(self.store.get_content(saved[-1]), "edit 2\nsaved mid-sync")
+
+if __name__ == "__main__":
+    unittest.main()
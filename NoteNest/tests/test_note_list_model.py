@@ -0,0 +1,78 @@
+"""The paged note list model keeping up with saves, against a temporary NoteStore."""
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+from NoteNest import NoteListModel
+from notebooks import SORT_CREATED, SORT_MODIFIED, SORT_TITLE
+from notestore import NoteStore
+
+app = QApplication.instance() or QApplication([])
+
+class NoteListModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = NoteStore(os.path.join(self.folder.name, "notes.db"))
+        self.ids = {title: self.store.save_note(title, f"{title}\nbody")[0] for title in "abcdef"}
+
+    def tearDown(self):
+        self.store.close()
+        self.folder.cleanup()
+
+    def model(self, sort, page_size=3):
+        model = NoteListModel(self.store, page_size=page_size)
+        model.set_view(sort, None, None)
+        model.reload()
+        model.fetchMore()
+        return model
+
+    def save(self, model, title, new_title):
+        note_id = self.ids.pop(title)
+        self.ids[new_title] = note_id
+        self.store.save_note(new_title, f"{new_title}\nbody", note_id)
+        model.note_saved(note_id, new_title)
+
+    def test_last_fetched_row_saved_in_place_stays_listed(self):
+        model = self.model(SORT_TITLE)
+        self.save(model, "c", "c")
+
+        self.assertEqual(model.titles, ["a", "b", "c"])
+        model.all_rows()
+        self.assertEqual(model.titles, ["a", "b", "c", "d", "e", "f"])
+
+    def test_row_renamed_past_the_loaded_pages_is_fetched_later(self):
+        model = self.model(SORT_TITLE)
+        self.save(model, "c", "zz")
+
+        self.assertEqual(model.titles, ["a", "b"])
+        model.all_rows()
+        self.assertEqual(model.titles, ["a", "b", "d", "e", "f", "zz"])
+
+    def test_saves_match_a_full_reload(self):
+        rng = random.Random(1)
+        for trial in range(100):
+            sort = rng.choice([SORT_CREATED, SORT_MODIFIED, SORT_TITLE])
+            model = self.model(sort, rng.randint(1, 4))
+            for _ in range(rng.randint(0, 2)):
+                model.fetchMore()
+            for step in range(rng.randint(1, 4)):
+                title = rng.choice(list(self.ids))
+                renamed = "".join(rng.choices("abcdefghij", k=3)) + f"{trial}.{step}"
+                self.save(model, title, rng.choice([title, renamed]))
+                if rng.random() < 0.3:
+                    new_title = f"new {trial}.{step}"
+                    self.ids[new_title] = self.store.save_note(new_title, f"{new_title}\nbody")[0]
+                    model.note_saved(self.ids[new_title], new_title)
+            model.all_rows()
+            self.assertEqual(model.titles, self.model(sort, 1000).titles, (trial, sort))
+
+if __name__ == "__main__":
+    unittest.main()
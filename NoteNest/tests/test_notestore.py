@@ -0,0 +1,110 @@
+"""NoteStore saves, imports and search against a temporary database."""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunks import LARGE_NOTE_CHARS
+from notestore import NoteStore
+
+class NoteStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = NoteStore(os.path.join(self.folder.name, "notes.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.folder.cleanup()
+
+    def test_new_note_never_overwrites_one_with_its_title(self):
+        note_id, _ = self.store.save_note("Todo", "Todo\nimportant existing content")
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.store.save_note("Todo", "Todo")
+        self.assertEqual(self.store.get_content(note_id), "Todo\nimportant existing content")
+
+    def test_rename_onto_another_title_is_refused(self):
+        self.store.save_note("first", "first\none")
+        second, version = self.store.save_note("second", "second\ntwo")
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.store.save_note("first", "first\ntwo", second, version)
+        self.assertEqual(self.store.get_content(second), "second\ntwo")
+
+    def test_deleted_note_is_saved_again_as_a_new_note(self):
+        note_id, version = self.store.save_note("note", "note\nbody")
+        self.store.delete_note(note_id)
+
+        new_id, new_version = self.store.save_note("note", "note\nbody again", note_id, version)
+        self.assertNotEqual(new_id, note_id)
+        self.assertEqual((new_version, self.store.get_content(new_id)), (1, "note\nbody again"))
+
+    def test_import_replaces_by_title_only_when_asked(self):
+        note_id, _ = self.store.save_note("note", "note\nold")
+
+        self.assertEqual(self.store.import_notes([("note", "note\nnew")]), (1, 0))
+        self.assertEqual(self.store.get_content(note_id), "note\nold")
+        self.assertEqual(self.store.import_notes([("note", "note\nnew")], replace=True), (1, 1))
+        self.assertEqual(self.store.get_content(note_id), "note\nnew")
+
+    def titles_matching(self, text):
+        return [title for _, title, _ in self.store.search(text)]
+
+    def test_search_follows_saves_imports_and_deletes(self):
+        note_id, version = self.store.save_note("fruit", "fruit\napples")
+        self.store.import_notes([("veg", "veg\ncarrots"), ("veg", "veg\nleeks")], replace=True)
+        self.store.save_note("fruit", "fruit\npears", note_id, version)
+
+        self.assertEqual(self.titles_matching("apples"), [])
+        self.assertEqual(self.titles_matching("pears"), ["fruit"])
+        self.assertEqual(self.titles_matching("leeks"), ["veg"])
+        self.assertEqual(self.titles_matching("carrots"), [])
+        self.store.delete_note(note_id)
+        self.assertEqual(self.titles_matching("pears"), [])
+
+    def test_search_follows_chunked_notes(self):
+        text = "".join(f"line {i} word{i % 997}\n" for i in range(LARGE_NOTE_CHARS // 12))
+        note_id, version = self.store.save_note("big", text)
+        note_id, version = self.store.save_note("big", text.replace("word5\n", "changed\n"), note_id, version)
+
+        self.assertEqual(self.titles_matching("changed"), ["big"])
+        self.assertEqual(self.titles_matching("word5"), [])
+        self.store.save_note("big", "big\nsmall again", note_id, version)
+        self.assertEqual(self.titles_matching("changed"), [])
+        self.assertEqual(self.titles_matching("small"), ["big"])
+
+    def test_compression_changes_neither_version_nor_index(self):
+        note_id, _ = self.store.save_note("note", "note\nunique " + "text " * 5000)
+        # As saved before compression existed
+        with self.store.write() as conn:
+            conn.execute("UPDATE notes SET content = ? WHERE id = ?", (self.store.get_content(note_id), note_id))
+        version = self.store.note_version(note_id)
+        self.assertEqual(self.store.compress_notes(), 1)
+
+        self.assertEqual(self.store.note_version(note_id), version)
+        self.assertEqual(self.titles_matching("unique"), ["note"])
+
+    def test_notes_can_be_written_from_plain_sqlite3(self):
+        self.store.save_note("fruit", "fruit\napples")
+        self.store.save_note("veg", "veg\ncarrots")
+        self.store.close()
+
+        conn = sqlite3.connect(os.path.join(self.folder.name, "notes.db"))
+        with conn:
+            conn.execute("UPDATE notes SET content = 'fruit\npears' WHERE title = 'fruit'")
+            conn.execute("INSERT INTO notes (title, content) VALUES ('nuts', 'nuts\nalmonds')")
+            conn.execute("DELETE FROM notes WHERE title = 'veg'")
+        conn.close()
+
+        self.store = NoteStore(os.path.join(self.folder.name, "notes.db"))
+        self.assertEqual(self.titles_matching("apples"), [])
+        self.assertEqual(self.titles_matching("pears"), ["fruit"])
+        self.assertEqual(self.titles_matching("almonds"), ["nuts"])
+        self.assertEqual(self.titles_matching("carrots"), [])
+
+if __name__ == "__main__":
+    unittest.main()
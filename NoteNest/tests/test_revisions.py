@@ -0,0 +1,89 @@
+"""Revision history: replaying deltas from snapshots, and compaction."""
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from revisions import (
+    REVISIONS_SCHEMA, SNAPSHOT_INTERVAL, compact_history, list_revisions, load_revision, record_revision
+)
+
+NOTE_ID = 1
+
+def edited(text, i):
+    """text with one line changed, one added and one dropped, like a local edit."""
+    lines = text.splitlines(keepends=True)
+    lines[i % len(lines)] = f"edited line {i}\n"
+    lines.insert((i * 7) % len(lines), f"added line {i}\n")
+    del lines[(i * 13) % len(lines)]
+    return "".join(lines)
+
+class RevisionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY)")
+        self.conn.executescript(REVISIONS_SCHEMA)
+        self.versions = {}
+
+    def tearDown(self):
+        self.conn.close()
+
+    def record(self, count):
+        text = "".join(f"line {i}\n" for i in range(500))
+        previous = None
+        for i in range(count):
+            rev = record_revision(self.conn, NOTE_ID, text, previous)
+            self.versions[rev] = text
+            previous, text = text, edited(text, i)
+
+    def snapshots(self):
+        return [rev for rev, in self.conn.execute(
+            "SELECT rev FROM note_revisions WHERE note_id = ? AND is_snapshot ORDER BY rev", (NOTE_ID,)
+        )]
+
+    def test_every_revision_is_rebuilt_across_snapshots(self):
+        self.record(3 * SNAPSHOT_INTERVAL + 5)
+
+        self.assertEqual(self.snapshots(), [1, 1 + SNAPSHOT_INTERVAL, 1 + 2 * SNAPSHOT_INTERVAL,
+                                            1 + 3 * SNAPSHOT_INTERVAL])
+        for rev, text in self.versions.items():
+            self.assertEqual(load_revision(self.conn, NOTE_ID, rev), text, rev)
+        self.assertIsNone(load_revision(self.conn, NOTE_ID, len(self.versions) + 1))
+
+    def test_unchanged_content_adds_no_revision(self):
+        self.assertEqual(record_revision(self.conn, NOTE_ID, "same"), 1)
+        self.assertIsNone(record_revision(self.conn, NOTE_ID, "same", "same"))
+
+    def test_unknown_base_stores_a_snapshot(self):
+        record_revision(self.conn, NOTE_ID, "one\n")
+        # The note was changed without a revision in between, e.g. by an import
+        self.assertEqual(record_revision(self.conn, NOTE_ID, "three\n", "two\n"), 2)
+        self.assertEqual(self.snapshots(), [1, 2])
+        self.assertEqual(load_revision(self.conn, NOTE_ID, 2), "three\n")
+
+    def test_compaction_drops_whole_chains_oldest_first(self):
+        self.record(3 * SNAPSHOT_INTERVAL + 5)
+
+        compact_history(self.conn, NOTE_ID, max_revisions=2 * SNAPSHOT_INTERVAL)
+        kept = sorted(rev for rev, _ in list_revisions(self.conn, NOTE_ID))
+
+        self.assertEqual(kept, list(range(1 + 2 * SNAPSHOT_INTERVAL, len(self.versions) + 1)))
+        self.assertEqual(self.snapshots()[0], kept[0])
+        self.assertIsNone(load_revision(self.conn, NOTE_ID, kept[0] - 1))
+        for rev in kept:
+            self.assertEqual(load_revision(self.conn, NOTE_ID, rev), self.versions[rev], rev)
+
+    def test_compaction_keeps_the_newest_chain_over_budget(self):
+        self.record(SNAPSHOT_INTERVAL + 5)
+
+        compact_history(self.conn, NOTE_ID, max_revisions=1, max_bytes=1)
+        kept = sorted(rev for rev, _ in list_revisions(self.conn, NOTE_ID))
+
+        self.assertEqual(kept, list(range(1 + SNAPSHOT_INTERVAL, len(self.versions) + 1)))
+        self.assertEqual(load_revision(self.conn, NOTE_ID, kept[-1]), self.versions[kept[-1]])
+
+if __name__ == "__main__":
+    unittest.main()